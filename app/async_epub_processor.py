@@ -92,8 +92,9 @@ class AsyncEpubProcessor(object):
             print(f"🚀 Начинаем асинхронную обработку EPUB: {epub_path}")
             
             # Читаем EPUB файл
-            book_reader = EpubReader(epub_path)
-            book_title = book_reader.get_booktitle()
+            with EpubReader(epub_path) as book_reader:
+                book_title = book_reader.get_booktitle()
+                total_items = len(book_reader.item_ids)
             print(f"📚 Название книги: {book_title}")
             
             if not book_title:
@@ -106,8 +107,6 @@ class AsyncEpubProcessor(object):
             if book_id is None:
                 raise ValueError(f"Не удалось создать книгу: {book_name}")
             
-            # Получаем общее количество элементов
-            total_items = len(book_reader.item_ids)
             print(f"📊 Всего элементов для обработки: {total_items}")
             
             # Отправляем начальное сообщение
@@ -130,6 +129,7 @@ class AsyncEpubProcessor(object):
         """
         Продолжаем обработку EPUB файла (последующие вызовы)
         """
+        book_reader = None
         try:
             print(f"🔄 Продолжаем обработку книги ID: {book_id}")
             
@@ -149,44 +149,43 @@ class AsyncEpubProcessor(object):
             # Создаем новый reader для продолжения
             book_reader = EpubReader(epub_path)
             
-            # Пропускаем уже обработанные элементы
-            for i in range(current_item_index):
-                if len(book_reader.item_ids) > 0:
-                    book_reader.item_ids.pop(0)
+            # Продолжаем с первого необработанного элемента
+            book_reader.seek(current_item_index)
             
             # Обрабатываем батч элементов (максимум 5 за раз)
             batch_size = 5
             processed_in_batch = 0
             total_chunks_created = 0
             
-            while (len(book_reader.item_ids) > 0 and 
+            while (book_reader.remaining() > 0 and 
                    processed_in_batch < batch_size and 
                    current_item_index < total_items):
                 
                 print(f"🔄 Обрабатываем элемент {current_item_index + 1}/{total_items}")
                 
                 text = book_reader.get_next_item_text()
+                # get_next_item_text пропускает пустые элементы - позиция берется из курсора
+                item_index = book_reader.cursor - 1
+                current_item_index = max(book_reader.cursor, current_item_index + 1)
                 if text and text.strip():
                     try:
                         chunks_created = self.chunk_manager.create_chunks(book_id, text, sending_mode)
                         total_chunks_created += chunks_created
-                        processed_items.append(current_item_index)
+                        processed_items.append(item_index)
                         processed_in_batch += 1
-                        current_item_index += 1
                         
                         print(f"✅ Обработан элемент {current_item_index}, создано чанков: {chunks_created}")
                         
                     except Exception as e:
-                        print(f"❌ Ошибка обработки элемента {current_item_index}: {e}")
-                        current_item_index += 1
+                        print(f"❌ Ошибка обработки элемента {item_index}: {e}")
                 else:
-                    print(f"⚠️ Пустой элемент {current_item_index}, пропускаем")
-                    current_item_index += 1
+                    print(f"⚠️ Пустой элемент {item_index}, пропускаем")
             
             # Проверяем, завершена ли обработка
             if current_item_index >= total_items:
                 # Обработка завершена
                 self._clear_processing_state(book_id)
+                self.db.update_book_status(book_id, 'ready')
                 self._send_progress_message(bot, chat_id, 
                     f"🎉 Обработка книги завершена!\n📊 Всего элементов: {total_items}\n📚 Создано чанков: {total_chunks_created}")
                 print(f"🎉 Обработка книги {book_id} полностью завершена!")
@@ -209,6 +208,9 @@ class AsyncEpubProcessor(object):
             import traceback
             print(f"❌ Traceback: {traceback.format_exc()}")
             return None
+        finally:
+            if book_reader is not None:
+                book_reader.close()
 
     def process_epub_async(self, user_id, epub_path, sending_mode='by_sense', bot=None, chat_id=None):
         """
@@ -217,8 +219,8 @@ class AsyncEpubProcessor(object):
         """
         try:
             # Создаем имя книги для поиска
-            book_reader = EpubReader(epub_path)
-            book_title = book_reader.get_booktitle()
+            with EpubReader(epub_path) as book_reader:
+                book_title = book_reader.get_booktitle()
             book_name = self._make_filename(user_id, book_title)
             
             # Ищем существующую книгу
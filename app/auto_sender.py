@@ -6,18 +6,45 @@
 
 import os
 import json
-import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 from db_manager import DbManager
+from metrics import query_histogram
+from delivery_engine import DeliveryEngine, TelegramRateLimiter, TooManyRequests
+from telegram_client import TelegramClient, telegram_histogram
+from message_splitter import MessageSplitter
+from queue_sender import QueueSender
 from shared_functions import send_portion
 import config
 
 
+def trigger_time(event):
+    """
+    Время срабатывания таймера из события триггера (UTC, как datetime.now() в функции).
+    Слот автопересылки считается по нему, а не по времени запуска: задержанный или
+    повторный вызов попадает в тот же слот
+
+    Returns:
+        datetime: Время срабатывания, текущее время, если в событии его нет
+    """
+    try:
+        message = event['messages'][0] if 'messages' in event else event
+        # '2024-01-01T20:20:00.123456Z' - доли секунды не нужны, время в UTC
+        return datetime.strptime(message['event_metadata']['created_at'][:19], '%Y-%m-%dT%H:%M:%S')
+    except (KeyError, IndexError, TypeError, ValueError):
+        print("⚠️ В событии триггера нет времени срабатывания, используем текущее")
+        return datetime.now()
+
+
 class AutoSender:
     """Класс для автоматической отправки чанков пользователям"""
     
-    def __init__(self):
+    def __init__(self, shards=1):
         self.db = DbManager()
+        # шарды слота отправляют одновременно, а лимит Telegram общий на бота - делим его между ними
+        self.engine = DeliveryEngine(limiter=TelegramRateLimiter(config.telegram_global_rate / max(shards, 1)))
+        self.telegram = TelegramClient.shared()
+        self.queue_sender = QueueSender() if os.environ.get('MESSAGE_QUEUE_URL') else None
+        self.splitter = MessageSplitter()
         self.bot_token = os.environ.get('TOKEN')
         if not self.bot_token:
             raise ValueError("TOKEN environment variable not set")
@@ -34,7 +61,7 @@ class AutoSender:
         """
         return self.db.get_users_for_auto_send_by_time(current_time)
     
-    def send_portion_to_user(self, user_id, chat_id, lang='ru'):
+    def send_portion_to_user(self, user_id, chat_id, lang='ru', portion=None, prefetched=False):
         """
         Отправляет следующий чанк пользователю
         Использует общую функцию send_portion из shared_functions
@@ -43,6 +70,8 @@ class AutoSender:
             user_id: ID пользователя
             chat_id: ID чата
             lang: Язык пользователя
+            portion: Уже прочитанный чанк (опционально)
+            prefetched: portion прочитан заранее, повторно не читать
             
         Returns:
             dict: Результат отправки
@@ -51,7 +80,7 @@ class AutoSender:
             print(f"📤 Отправляем чанк пользователю {user_id}")
             
             # Используем общую функцию send_portion (bot=None для автопересылки)
-            result = send_portion(user_id, chat_id, bot=None)
+            result = send_portion(user_id, chat_id, bot=None, portion=portion, prefetched=prefetched)
             
             if isinstance(result, dict):
                 # Результат от общей функции для автопересылки
@@ -78,34 +107,168 @@ class AutoSender:
     
     def _send_telegram_message(self, chat_id, text):
         """
-        Отправляет сообщение в Telegram
+        Отправляет сообщение в Telegram с учетом лимитов (общий и на чат)
         
         Args:
             chat_id: ID чата
             text: Текст сообщения
         """
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        
-        # Разбиваем длинные сообщения на части
-        max_telegram_size = 4096
-        for i in range(0, len(text), max_telegram_size):
-            chunk = text[i:i+max_telegram_size]
-            
-            payload = {
-                'chat_id': chat_id,
-                'text': chunk,
-                'parse_mode': 'HTML'
-            }
-            
+        # Разбиваем длинные сообщения на части по границам абзацев и предложений
+        for chunk in self.splitter.split(text):
             try:
-                response = requests.post(url, json=payload, timeout=10)
-                response.raise_for_status()
+                self.engine.send(chat_id, lambda: self._post_message(chat_id, chunk))
                 print(f"✅ Сообщение отправлено в чат {chat_id}")
             except Exception as e:
                 print(f"❌ Ошибка отправки в чат {chat_id}: {e}")
                 raise
+
+    def _post_message(self, chat_id, text):
+        # один запрос sendMessage, 429 -> TooManyRequests с retry_after из ответа
+        response = self.telegram.send_message(chat_id, text, token=self.bot_token)
+        if response.status_code == 429:
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            retry_after = body.get('parameters', {}).get('retry_after', 1)
+            raise TooManyRequests(retry_after, body.get('description', ''))
+        response.raise_for_status()
+        return response
     
     
+    def _deliver_batch(self, users, portions, prefetched, slot=None):
+        """
+        Отправляет чанки пользователям параллельно, с лимитами Telegram.
+        Для доставок из delivery_ledger (slot задан) результат отмечается там же:
+        отправленные - sent (позиция сдвигается), неотправленные из-за ошибки возвращаются для повтора
+
+        Returns:
+            tuple: (успешных отправок, ошибок, статистика DeliveryEngine)
+        """
+        def deliver(user):
+            return self.send_portion_to_user(
+                user['user_id'],
+                user['chat_id'],
+                user['lang'],
+                portions.get(user['user_id']),
+                prefetched
+            )
+
+        results, delivery_stats = self.engine.run(users, deliver)
+
+        successful_sends = 0
+        errors = 0
+        sent_user_ids = []
+        failed = []
+        for user, result in zip(users, results):
+            if result['success']:
+                successful_sends += 1
+            else:
+                errors += 1
+                print(f"⚠️ Не удалось отправить пользователю {user['user_id']}: {result.get('reason', result.get('error', 'unknown'))}")
+            if 'error' in result:
+                failed.append(user)
+            else:
+                sent_user_ids.append(user['user_id'])
+
+        if slot is not None:
+            self.db.finish_deliveries(slot, sent_user_ids, failed)
+        return successful_sends, errors, delivery_stats
+
+    def fan_out(self, current_time):
+        """
+        Создает запуск слота из config.auto_send_shards шардов и отправляет их в очередь.
+        Заодно заново ставит в очередь шарды, которые перестали сохранять прогресс (упали или
+        не уложились в таймаут) - они продолжат с последней контрольной точки
+
+        Returns:
+            dict: Статистика постановки в очередь
+        """
+        shards = config.auto_send_shards
+        slot = self.db.delivery_slot(current_time)
+        created = self.db.create_auto_send_run(slot, shards) or []
+        queued = 0
+        for shard in created:
+            queued += self._queue_shard(slot, shard, shards)
+
+        since_slot = (current_time - timedelta(days=1)).strftime('%Y-%m-%d %H:%M')
+        resumed = 0
+        for run in self.db.get_stale_auto_send_runs(since_slot, config.auto_send_shard_timeout):
+            print(f"♻️ Шард {run['shard']} слота {run['slot']} не отвечает, продолжаем с userId={run['lastUserId']}")
+            # отметка времени, чтобы следующий запуск таймера не отправил шард еще раз
+            self.db.checkpoint_auto_send_run(run['slot'], run['shard'], run['lastUserId'],
+                                             run['delivered'], 'queued')
+            resumed += self._queue_shard(run['slot'], run['shard'], run['shards'])
+
+        stats = {
+            'success': True,
+            'slot': slot,
+            'shards': shards,
+            'shards_queued': queued,
+            'shards_resumed': resumed
+        }
+        print(f"📊 Запуск автопересылки по шардам: {stats}")
+        return stats
+
+    def _queue_shard(self, slot, shard, shards):
+        sent = self.queue_sender.send_auto_send_shard_message({
+            'slot': slot,
+            'time': slot[-5:],
+            'shard': shard,
+            'shards': shards
+        })
+        return 1 if sent else 0
+
+    def process_shard(self, shard_data):
+        """
+        Обрабатывает шард слота: пользователи с userId % shards == shard, после
+        последней контрольной точки. Прогресс сохраняется после каждой страницы
+
+        Args:
+            shard_data: slot, time, shard, shards из сообщения очереди
+
+        Returns:
+            dict: Статистика шарда
+        """
+        slot, shard, shards = shard_data['slot'], int(shard_data['shard']), int(shard_data['shards'])
+        run = self.db.get_auto_send_run(slot, shard)
+        if run is not None and run['status'] == 'done':
+            print(f"✅ Шард {shard} слота {slot} уже обработан")
+            return {'success': True, 'slot': slot, 'shard': shard, 'skipped': True}
+
+        last_user_id = run['lastUserId'] if run else 0
+        delivered = run['delivered'] if run else 0
+        self.db.checkpoint_auto_send_run(slot, shard, last_user_id, delivered, 'running')
+        print(f"🚀 Шард {shard}/{shards} слота {slot}, начиная после userId={last_user_id}")
+
+        errors = 0
+        delivery_stats = {}
+        pages = self.db.iter_due_delivery_pages(slot, shard=shard, shards=shards,
+                                                after_user_id=last_user_id)
+        for page in pages:
+            if page is None:
+                # шард будет поставлен в очередь заново и продолжит с контрольной точки
+                raise RuntimeError(f"Не удалось прочитать страницу шарда {shard} слота {slot}")
+            portions = {delivery['user_id']: delivery['portion'] for delivery in page}
+            page_sent, page_errors, page_stats = self._deliver_batch(page, portions, True, slot)
+            delivered += page_sent
+            errors += page_errors
+            delivery_stats = DeliveryEngine.merge_stats(delivery_stats, page_stats)
+            last_user_id = page[-1]['user_id']
+            self.db.checkpoint_auto_send_run(slot, shard, last_user_id, delivered, 'running')
+
+        self.db.checkpoint_auto_send_run(slot, shard, last_user_id, delivered, 'done')
+        stats = {
+            'success': True,
+            'slot': slot,
+            'shard': shard,
+            'delivered': delivered,
+            'errors': errors,
+            'delivery': delivery_stats
+        }
+        print(f"📊 Шард автопересылки обработан: {stats}")
+        return stats
+
     def process_auto_send(self, current_time):
         """
         Основная функция обработки автопересылки
@@ -117,51 +280,53 @@ class AutoSender:
             dict: Статистика обработки
         """
         print(f"🚀 Начинаем автопересылку в {current_time.strftime('%H:%M')}")
+
+        if config.auto_send_shards > 1 and self.queue_sender is not None:
+            # большой слот делится на шарды, их обрабатывают экземпляры функции из очереди
+            return self.fan_out(current_time)
         
-        # Получаем пользователей для отправки по их предпочтительному времени
-        users = self.get_users_for_auto_send_by_time(current_time)
-        
-        if not users:
-            print("📭 Нет пользователей для автопересылки")
-            return {
-                'success': True,
-                'users_processed': 0,
-                'successful_sends': 0,
-                'errors': 0
-            }
-        
-        # Обрабатываем каждого пользователя
+        # Пользователи слота и их чанки - постранично: страница читается, отправляется
+        # и отмечается в delivery_ledger, только потом читается следующая
+        slot = self.db.delivery_slot(current_time)
+        users_processed = 0
         successful_sends = 0
         errors = 0
-        
-        for user in users:
-            try:
-                result = self.send_portion_to_user(
-                    user['user_id'], 
-                    user['chat_id'], 
-                    user['lang']
-                )
-                
-                if result['success']:
-                    successful_sends += 1
-                else:
-                    errors += 1
-                    print(f"⚠️ Не удалось отправить пользователю {user['user_id']}: {result.get('reason', 'unknown')}")
-                    
-            except Exception as e:
-                errors += 1
-                print(f"❌ Критическая ошибка для пользователя {user['user_id']}: {e}")
-        
+        delivery_stats = {}
+        pages = 0
+        for page in self.db.iter_due_delivery_pages(slot):
+            if page is None:
+                if pages == 0:
+                    # без страницы нет и строк delivery_ledger - ничего не отправляем,
+                    # повтор вызова с тем же временем срабатывания обработает тот же слот
+                    raise RuntimeError(f"Не удалось прочитать первую страницу слота {slot}")
+                print(f"❌ Ошибка чтения страницы {pages + 1} слота {slot}, остальные пользователи пропущены")
+                break
+            pages += 1
+            portions = {delivery['user_id']: delivery['portion'] for delivery in page}
+            page_sent, page_errors, page_stats = self._deliver_batch(page, portions, True, slot)
+            users_processed += len(page)
+            successful_sends += page_sent
+            errors += page_errors
+            delivery_stats = DeliveryEngine.merge_stats(delivery_stats, page_stats)
+
+        if users_processed == 0:
+            print("📭 Нет пользователей для автопересылки")
+
         stats = {
             'success': True,
-            'users_processed': len(users),
+            'users_processed': users_processed,
             'successful_sends': successful_sends,
             'errors': errors,
+            'pages': pages,
             'current_time': current_time.isoformat(),
-            'time_slot': current_time.strftime('%H:%M')
+            'time_slot': current_time.strftime('%H:%M'),
+            'delivery': delivery_stats
         }
-        
         print(f"📊 Статистика автопересылки: {stats}")
+        print(f"🐢 Самые медленные запросы YDB (p99, s): {query_histogram.top(limit=5)}")
+        print(f"📡 Запросы к Telegram (p99, s): {telegram_histogram.top(limit=5)}")
+        if config.metrics_prometheus_dump:
+            print(query_histogram.dump() + telegram_histogram.dump())
         return stats
 
 
@@ -179,8 +344,8 @@ def handler(event, context):
     print(f"🔄 Получено событие автопересылки: {event}")
     
     try:
-        # Получаем текущее время
-        current_time = datetime.now()
+        # Время срабатывания таймера, а не время запуска функции
+        current_time = trigger_time(event)
         
         # Создаем отправитель и обрабатываем
         auto_sender = AutoSender()
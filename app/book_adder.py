@@ -58,8 +58,8 @@ class BookAdder(object):
             
             # Создаем временную запись о книге для отслеживания
             from epub_reader import EpubReader
-            book_reader = EpubReader(epub_path)
-            book_title = book_reader.get_booktitle()
+            with EpubReader(epub_path) as book_reader:
+                book_title = book_reader.get_booktitle()
             
             if book_title:
                 book_name = self._make_filename(user_id, book_title)
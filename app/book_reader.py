@@ -2,6 +2,7 @@ import os
 import config
 from books_library import BooksLibrary
 from txt_file import BookChunkManager
+from row_mapper import RowMapper
 
 
 class BookReader():
@@ -14,27 +15,45 @@ class BookReader():
         # self.db = database.DataBase()
         self.books_lib = BooksLibrary()
         self.chunk_manager = BookChunkManager()
+        self.rows = RowMapper()
 
-    def get_next_portion(self, user_id):
+    def read_next(self, user_id):
+        """
+        Next chunk of the current book with moving position.
+        Returns dict with text, lang, pos and end_of_book
+        or None if user has no current book
+        """
         try:
-            # Получаем информацию о текущей книге пользователя
-            book_id, book_name, pos, mode = self.books_lib.get_current_book(user_id)
-            if book_id is None or book_name is None: 
-                return None
-
-            # Получаем следующий чанк текста
-            text_piece, new_pos = self.chunk_manager.read_piece(book_id, pos)
-            
-            # Если чанк не найден, проверяем, не закончилась ли книга
-            if text_piece is None:
-                total_chunks = self.chunk_manager.get_total_chunks(book_id)
-                if pos >= total_chunks:
-                    return config.end_book_string
+            # позиция двигается в базе, а текст берется из кэша чанков
+            state = self.books_lib.advance_position(user_id)
+            if state is None:
                 return None
-
-            # Если чанк найден, обновляем позицию в книге
-            self.books_lib.update_book_pos(user_id, book_id, new_pos)
-            return text_piece
+            if state['chunkCount'] is None:
+                # у книги еще нет счетчика чанков - читаем по-старому, одним запросом
+                return self.books_lib.read_next_chunk(user_id)
+            text = None
+            if state['pos'] < state['chunkCount']:
+                text, _ = self.chunk_manager.read_piece(state['bookId'], state['pos'])
+                if text is None:
+                    # позиция уже сдвинута, а чанк не прочитан - возвращаем ее назад
+                    self.books_lib.update_book_pos(user_id, state['bookId'], state['pos'])
+                    return None
+            return self.rows.to_portion(dict(state, text=text))
         except Exception as e:
-            print(f"Error in get_next_portion: {str(e)}")
+            print(f"Error in read_next: {str(e)}")
             return None
+
+    def portion_text(self, portion):
+        # text for user: chunk, end of book mark or None if no current book
+        if portion is None:
+            return None
+        if portion['end_of_book']:
+            return config.end_book_string
+        if portion['text'] is None:
+            # читатель догнал загрузку книги - следующий чанк еще не записан
+            lang = portion['lang'] if portion['lang'] in config.message_book_processing else 'ru'
+            return config.message_book_processing[lang]
+        return portion['text']
+
+    def get_next_portion(self, user_id):
+        return self.portion_text(self.read_next(user_id))
@@ -6,12 +6,11 @@ from text_replacer import TextReplacer
 class BooksLibrary(object):
     """
     Class for manage user books and auto status
-    Manage cache for lang
+    User state (lang, auto status, current book) is cached by DbManager
     """
 
     def __init__(self):
         self.db = DbManager()
-        self.lang_cache = {}
         self.text_replacer = TextReplacer()
 
     def update_current_book(self, user_id, chat_id, book_id):
@@ -23,6 +22,14 @@ class BooksLibrary(object):
         self.db.update_book_pos(user_id, book_id, new_pos)
         pass
 
+    def read_next_chunk(self, user_id):
+        # chunk of current book with moving position in one request
+        return self.db.read_next_chunk(user_id)
+
+    def advance_position(self, user_id):
+        # moving position without reading text of chunk
+        return self.db.advance_position(user_id)
+
     def switch_auto_status(self, user_id):
         if self.db.get_auto_status(user_id):
             self.db.update_auto_status(user_id, False)
@@ -32,19 +39,16 @@ class BooksLibrary(object):
 
     def update_lang(self, user_id, lang):
         self.db.update_user_lang(user_id, lang)
-        self.lang_cache[user_id] = lang
         return 0
 
     def get_pos(self, user_id, book_id):
         return self.db.get_book_pos(user_id, book_id)
 
     def get_lang(self, user_id):
-        lang = self.lang_cache.get(user_id, None)
+        lang = self.db.get_user_lang(user_id)
         if lang is None:
-            lang = self.db.get_user_lang(user_id)
-            if lang is None:
-                lang = 'ru'
-                self.update_lang(user_id, lang)
+            lang = 'ru'
+            self.update_lang(user_id, lang)
         return lang
 
     def get_user_books(self, user_id):
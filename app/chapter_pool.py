@@ -0,0 +1,113 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import config
+from epub_container import EpubContainer
+from xhtml_text_extractor import XhtmlTextExtractor
+from txt_file import BookChunkManager
+
+
+_worker_container = None  # (pid, EpubContainer) opened in this worker process
+
+
+def _container_of_worker(epub_path):
+    # archive is opened in every worker itself and kept for the next chapters of the same book
+    global _worker_container
+    if _worker_container is not None:
+        pid, container = _worker_container
+        if pid == os.getpid() and container.epub_path == epub_path:
+            return container
+        if pid == os.getpid():
+            container.close()
+    container = EpubContainer(epub_path)
+    _worker_container = (os.getpid(), container)
+    return container
+
+
+def chapter_chunks(epub_path, item_id, sent_mode, container=None):
+    """
+    Текст главы и ее чанки. Выполняется в процессе пула: получает путь к EPUB,
+    а не содержимое главы, чтобы не передавать его между процессами
+
+    Returns:
+        list: Чанки главы (пустой, если в главе нет текста)
+    """
+    container = container or _container_of_worker(epub_path)
+    stream = container.open(item_id)
+    if stream is None:
+        print(f"⚠️ Элемент {item_id} не найден, пропускаем")
+        return []
+    with stream:
+        # строки главы сразу идут в разбивку на предложения и чанки, текст целиком не собирается
+        return list(BookChunkManager.iter_chunks(XhtmlTextExtractor().iter_lines(stream), sent_mode))
+
+
+class ChapterPool(object):
+    """
+    Extraction of chapter text and splitting it to chunks in a process pool.
+    Results come back in spine order; at most workers * 2 chapters are in flight.
+    Workers are spawned, not forked: the handler process has threads (YDB driver,
+    position flush timer) and open sockets which must not be copied into workers.
+    With one worker, or if the pool can't be started, chapters are processed
+    in the current process.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or config.book_ingest_workers
+
+    def iter_chunks(self, epub_path, item_ids, sent_mode):
+        """
+        Чанки глав по порядку
+
+        Yields:
+            tuple: (индекс в item_ids, id элемента, список чанков)
+        """
+        executor = self._start() if self.workers > 1 else None
+        if executor is None:
+            yield from self._iter_serial(epub_path, item_ids, sent_mode, 0)
+            return
+
+        with executor:
+            in_flight = deque()
+            next_index = 0
+            while next_index < len(item_ids) or in_flight:
+                while next_index < len(item_ids) and len(in_flight) < self.workers * 2:
+                    item_id = item_ids[next_index]
+                    in_flight.append((next_index, item_id,
+                                      executor.submit(chapter_chunks, epub_path, item_id, sent_mode)))
+                    next_index += 1
+                index, item_id, future = in_flight.popleft()
+                try:
+                    chunks = future.result()
+                except BrokenProcessPool as e:
+                    print(f"❌ Пул процессов остановился ({e}), продолжаем в текущем процессе")
+                    yield from self._iter_serial(epub_path, item_ids, sent_mode, index)
+                    return
+                except Exception as e:
+                    print(f"❌ Ошибка при обработке элемента {item_id}: {e}")
+                    chunks = []
+                yield index, item_id, chunks
+
+    def _start(self):
+        try:
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        except (OSError, NotImplementedError, ImportError) as e:
+            # в некоторых окружениях нет /dev/shm и семафоров для multiprocessing
+            print(f"⚠️ Пул процессов недоступен ({e}), главы обрабатываются последовательно")
+            return None
+
+    def _iter_serial(self, epub_path, item_ids, sent_mode, start):
+        container = EpubContainer(epub_path)
+        try:
+            for index in range(start, len(item_ids)):
+                item_id = item_ids[index]
+                try:
+                    chunks = chapter_chunks(epub_path, item_id, sent_mode, container)
+                except Exception as e:
+                    print(f"❌ Ошибка при обработке элемента {item_id}: {e}")
+                    chunks = []
+                yield index, item_id, chunks
+        finally:
+            container.close()
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+import config
+
+
+class ChunkCache(object):
+    """
+    Texts of book chunks by (book_id, chunk_id), LRU bounded by size in bytes.
+    Chunks are never changed after they are written, so entries are not invalidated,
+    only evicted. One cache is shared by the process (see shared()).
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or config.chunk_cache_max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def shared(cls):
+        # cache of the process, survives between invocations of a warm container
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def _text_size(self, text):
+        return len(text.encode('utf-8'))
+
+    def get(self, book_id, chunk_id):
+        key = (book_id, chunk_id)
+        with self._lock:
+            text = self._items.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, book_id, chunk_id, text):
+        if text is None:
+            return
+        size = self._text_size(text)
+        if size > self.max_bytes:
+            return
+        key = (book_id, chunk_id)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size_bytes -= self._text_size(old)
+            self._items[key] = text
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size_bytes -= self._text_size(evicted)
+                self.evictions += 1
+
+    def put_many(self, book_id, chunks):
+        # chunks: {chunk_id: text}
+        for chunk_id, text in chunks.items():
+            self.put(book_id, chunk_id, text)
+
+    def clear(self):
+        with self._lock:
+            self._items = OrderedDict()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'chunks': len(self._items),
+                'bytes': self.size_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -67,6 +67,10 @@ except FileNotFoundError:
             "ru": "Поздравляю! Книга окончена.",
             "en": "Congratulations! The book is finished."
         },
+        "message_book_processing": {
+            "ru": "Книга еще загружается, следующая часть появится чуть позже. Попробуйте /more через минуту.",
+            "en": "The book is still loading, the next part will be ready soon. Try /more in a minute."
+        },
         "message_dont_understand": {
             "ru": "Я не понял команду.",
             "en": "I do not understand this command."
@@ -101,6 +105,37 @@ except FileNotFoundError:
 path_for_save = '/tmp'  # path for saving files
 piece_size = 893  # 384 get approximately, for comfortable reading on smartphone
 max_msg_size = 4096 # restriction from telegram
+chunk_msg_reserve = 256  # room left in message for text added to chunk (/more, end of book)
+chunks_batch_size = 200  # chunks per one UPSERT while saving book
+# processes extracting and splitting chapters of a book, 1 - in the main process;
+# raise only for functions with several vCPU (os.cpu_count() reports the host, not the quota)
+book_ingest_workers = int(os.getenv('BOOK_INGEST_WORKERS', '1'))
+ingest_text_block_size = 64 * 1024  # characters of chapter split to sentences at once
+ingest_queue_batches = 4  # batches of chunks waiting for DB writer, extraction waits when it is full
+id_block_size = 20  # ids leased at once from id_counters
+chunk_prefetch_size = 20  # chunks read ahead on cache miss
+chunk_cache_max_bytes = 32 * 1024 * 1024  # text of chunks kept in memory of warm container
+user_state_ttl = 60  # seconds user state (lang, current book, ...) is cached
+user_state_cache_size = 10000  # users kept in user state cache
+# write-behind of reading positions: positions are written in batches, not on every chunk
+position_write_behind = os.getenv('POSITION_WRITE_BEHIND', 'false').lower() in ('true', '1', 'yes')
+position_flush_interval_ms = 500  # background flush period in write-behind mode
+position_flush_batch_size = 500  # positions per one UPSERT
+due_deliveries_page_size = 500  # users of auto-send slot read by one query
+auto_send_shards = int(os.getenv('AUTO_SEND_SHARDS', '1'))  # >1: slot is split by userId % N and sent via message queue
+auto_send_shard_timeout = 120  # seconds without checkpoint after which shard is queued again
+delivery_claim_timeout = 300  # seconds after which unfinished 'claimed' delivery of a slot can be taken again
+auto_send_workers = 16  # users processed at once by auto-send
+telegram_global_rate = 30  # messages per second for the whole bot
+telegram_chat_rate = 1  # messages per second to one chat
+telegram_max_retries = 3  # retries of a message after 429
+telegram_pool_size = 32  # keep-alive connections to api.telegram.org
+telegram_connect_timeout = 3.05  # seconds
+telegram_read_timeout = 10  # seconds
+slow_query_log_ms = int(os.getenv('YDB_SLOW_QUERY_MS', '500'))  # log queries slower than this, -1 to turn off
+ydb_warm_up = os.getenv('YDB_WARMUP', 'true').lower() in ('true', '1', 'yes')  # connect to YDB at container start
+# print YDB and Telegram histograms in Prometheus text format after auto-send (for log-based scraping)
+metrics_prometheus_dump = os.getenv('METRICS_PROMETHEUS_DUMP', 'false').lower() in ('true', '1', 'yes')
 
 end_book_string = '---THE END---'
 
@@ -124,6 +159,7 @@ message_help = cfg.get('message_help', '')
 message_poem_mode_ON = cfg.get('message_poem_mode_ON', '')
 message_poem_mode_OFF = cfg.get('message_poem_mode_OFF', '')
 message_book_finished = cfg.get('message_book_finished', '')
+message_book_processing = cfg.get('message_book_processing', '')
 message_dont_understand = cfg.get('message_dont_understand', '')
 message_now_reading = cfg.get('message_now_reading', '')
 message_booklist = cfg.get('message_booklist', '')
@@ -1,89 +1,264 @@
-import json
-import re
-import ast
 import sys
 import os
+import time
+import config
 from ydb_adapter import YdbAdapter
 from text_replacer import TextReplacer
+from row_mapper import RowMapper
+from id_allocator import IdAllocator
+from user_state_cache import UserStateCache
+from position_buffer import PositionWriteBuffer
 
 
 class DbManager:
     """interaction with DB, preparing requests and sending to execute"""
 
+    # Запросы уровня класса
+    update_book_pos_query = """
+        DECLARE $user_id AS Uint64;
+        DECLARE $book_id AS Uint64;
+        DECLARE $newpos AS Uint64;
+
+        UPDATE user_books
+        SET pos = $newpos
+        WHERE userId = $user_id AND bookId = $book_id;
+    """
+
+    get_user_lang_query = """
+        DECLARE $user_id AS Uint64;
+
+        SELECT lang FROM users
+        WHERE userId = $user_id;
+    """
+
+    save_chunks_batch_query = """
+        DECLARE $book_id AS Uint64;
+        DECLARE $chunks AS List<Struct<idx: Uint64, text: Utf8>>;
+
+        $first_id = COALESCE((SELECT chunkCount FROM books WHERE id = $book_id), 0ul);
+
+        UPSERT INTO book_chunks (bookId, chunkId, text)
+        SELECT $book_id AS bookId, $first_id + idx AS chunkId, text
+        FROM AS_TABLE($chunks);
+
+        UPSERT INTO books (id, chunkCount)
+        VALUES ($book_id, $first_id + ListLength($chunks));
+    """
+
+    # чанк на текущей позиции без сдвига (для записи позиций через PositionWriteBuffer)
+    peek_next_chunk_query = """
+        DECLARE $user_id AS Uint64;
+
+        $current = (
+            SELECT id, bookId, pos, mode
+            FROM user_books
+            WHERE userId = $user_id AND isActive = true
+            LIMIT 1
+        );
+
+        $lang = (SELECT lang FROM users WHERE userId = $user_id LIMIT 1);
+
+        $next = (
+            SELECT cur.id AS id, cur.bookId AS bookId, cur.pos AS pos, cur.mode AS mode,
+                   ch.text AS text, b.chunkCount AS chunkCount, b.status AS status
+            FROM $current AS cur
+            LEFT JOIN books AS b
+            ON b.id = cur.bookId
+            LEFT JOIN book_chunks AS ch
+            ON ch.bookId = cur.bookId AND ch.chunkId = cur.pos
+        );
+
+        SELECT bookId, pos, mode, text, chunkCount, status, $lang AS lang FROM $next;
+    """
+
+    read_next_chunk_query = peek_next_chunk_query + """
+        UPSERT INTO user_books (id, pos)
+        SELECT id, pos + 1 AS pos FROM $next
+        WHERE text IS NOT NULL;
+    """
+
+    read_position_query = """
+        DECLARE $user_id AS Uint64;
+
+        $current = (
+            SELECT id, bookId, pos, mode
+            FROM user_books
+            WHERE userId = $user_id AND isActive = true
+            LIMIT 1
+        );
+
+        $lang = (SELECT lang FROM users WHERE userId = $user_id LIMIT 1);
+
+        $next = (
+            SELECT cur.id AS id, cur.bookId AS bookId, cur.pos AS pos, cur.mode AS mode,
+                   b.chunkCount AS chunkCount, b.status AS status
+            FROM $current AS cur
+            LEFT JOIN books AS b
+            ON b.id = cur.bookId
+        );
+
+        SELECT bookId, pos, mode, chunkCount, status, $lang AS lang FROM $next;
+    """
+
+    advance_position_query = read_position_query + """
+        UPSERT INTO user_books (id, pos)
+        SELECT id, pos + 1 AS pos FROM $next
+        WHERE pos < chunkCount;
+    """
+
+    # страница пользователей слота автопересылки вместе с их чанком, без сдвига позиций
+    peek_due_deliveries_query = """
+        DECLARE $current_time AS Utf8;
+        DECLARE $last_user_id AS Uint64;
+        DECLARE $limit AS Uint64;
+        DECLARE $shard AS Uint64;
+        DECLARE $shards AS Uint64;
+        DECLARE $delivery_slot AS Utf8;
+        DECLARE $claim_before AS Uint64;
+
+        $slot = (
+            SELECT userId, id
+            FROM auto_send_schedule
+            WHERE time = $current_time AND userId > $last_user_id
+            AND userId % $shards = $shard
+            ORDER BY userId
+            LIMIT $limit
+        );
+
+        $due = (
+            SELECT u.id AS id, u.userId AS userId, u.chatId AS chatId, u.lang AS lang, u.time AS time,
+                   $delivery_slot AS deliverySlot
+            FROM $slot AS s
+            JOIN users AS u
+            ON u.id = s.id
+            WHERE u.isAutoSend = true AND u.time = $current_time
+        );
+
+        -- книги пользователей страницы читаются по индексу userId, а не сканом user_books
+        $active = (
+            SELECT id, userId, bookId, pos, mode
+            FROM user_books VIEW idx_user_id
+            WHERE userId IN (SELECT userId FROM $due) AND isActive = true
+        );
+
+        $rows = (
+            SELECT d.id AS id, d.userId AS userId, d.chatId AS chatId, d.lang AS lang, d.time AS time,
+                   ub.id AS userBookId, ub.bookId AS bookId, ub.pos AS pos, ub.mode AS mode,
+                   b.chunkCount AS chunkCount, b.status AS status, ch.text AS text,
+                   -- занятая, но не завершенная вовремя доставка (обработчик упал) доступна снова
+                   IF(l.status = 'claimed'u AND l.updatedAt < $claim_before, NULL, l.status) AS ledgerStatus
+            FROM $due AS d
+            LEFT JOIN $active AS ub
+            ON ub.userId = d.userId
+            LEFT JOIN books AS b
+            ON b.id = ub.bookId
+            LEFT JOIN book_chunks AS ch
+            ON ch.bookId = ub.bookId AND ch.chunkId = ub.pos
+            LEFT JOIN delivery_ledger AS l
+            ON l.slot = d.deliverySlot AND l.userId = d.userId
+        );
+
+        SELECT id, userId, chatId, lang, time, bookId, pos, mode, chunkCount, status, text, ledgerStatus
+        FROM $rows
+        ORDER BY userId;
+
+        -- LIMIT относится к строкам расписания, а не к $rows: продолжать нужно, пока расписание не кончится
+        SELECT COUNT(*) AS scanned, MAX(userId) AS lastUserId FROM $slot;
+    """
+
+    # пользователи без строки в delivery_ledger получают ее в том же запросе, что читает чанк:
+    # повтор слота, шарда или параллельный обработчик увидят ledgerStatus и не отправят чанк еще раз.
+    # Позиция здесь не сдвигается - только в mark_deliveries_sent_query после отправки.
+    # pos в ledger - отправляемый чанк (пустой, если чанка нет: книги нет или она закончилась)
+    claim_due_deliveries_query = peek_due_deliveries_query + """
+        DECLARE $now AS Uint64;
+
+        UPSERT INTO delivery_ledger (slot, userId, bookId, pos, status, updatedAt)
+        SELECT deliverySlot AS slot, userId, bookId, IF(text IS NOT NULL, pos) AS pos,
+               'claimed'u AS status, $now AS updatedAt
+        FROM $rows
+        WHERE ledgerStatus IS NULL;
+    """
+
+    # чанк отправлен: позиция сдвигается за него, если пользователь не сдвинул ее сам за это время
+    mark_deliveries_sent_query = """
+        DECLARE $delivery_slot AS Utf8;
+        DECLARE $user_ids AS List<Uint64>;
+        DECLARE $now AS Uint64;
+
+        $sent = (
+            SELECT slot, userId, bookId, pos
+            FROM delivery_ledger
+            WHERE slot = $delivery_slot AND userId IN $user_ids AND status = 'claimed'u
+        );
+
+        UPSERT INTO user_books (id, pos)
+        SELECT ub.id AS id, s.pos + 1 AS pos
+        FROM $sent AS s
+        JOIN user_books VIEW idx_user_id AS ub
+        ON ub.userId = s.userId AND ub.bookId = s.bookId
+        WHERE s.pos IS NOT NULL AND ub.pos = s.pos;
+
+        UPSERT INTO delivery_ledger (slot, userId, status, updatedAt)
+        SELECT slot, userId, 'sent'u AS status, $now AS updatedAt
+        FROM $sent;
+    """
+
+    # чанк не отправлен: строка удаляется, чтобы повтор слота отправил его снова (позиция не сдвигалась)
+    release_deliveries_query = """
+        DECLARE $delivery_slot AS Utf8;
+        DECLARE $user_ids AS List<Uint64>;
+
+        DELETE FROM delivery_ledger
+        WHERE slot = $delivery_slot AND userId IN $user_ids AND status = 'claimed'u;
+    """
+
+    update_book_status_query = """
+        DECLARE $book_id AS Uint64;
+        DECLARE $status AS Utf8;
+
+        UPDATE books
+        SET status = $status
+        WHERE id = $book_id;
+    """
+
+    users_for_auto_send_query = """
+        DECLARE $current_time AS Utf8;
+
+        $slot = (SELECT id FROM auto_send_schedule WHERE time = $current_time);
+
+        SELECT u.userId AS userId, u.chatId AS chatId, u.lang AS lang, u.time AS time
+        FROM $slot AS s
+        JOIN users AS u
+        ON u.id = s.id
+        WHERE u.isAutoSend = true AND u.time = $current_time;
+    """
+
+    # строка расписания есть только у пользователей с автопересылкой и заданным временем
+    sync_schedule_query = """
+        DECLARE $user_id AS Uint64;
+        DECLARE $old_time AS Utf8;
+
+        $user = (
+            SELECT time, userId, id FROM users
+            WHERE userId = $user_id AND isAutoSend = true AND time != ""
+        );
+
+        DELETE FROM auto_send_schedule
+        WHERE time = $old_time AND userId = $user_id;
+
+        UPSERT INTO auto_send_schedule (time, userId, id)
+        SELECT time, userId, id FROM $user;
+    """
+
     def __init__(self):
         self.db_adapter = YdbAdapter()
         self.text_replacer = TextReplacer()
-
-    def _text_to_json(self, text):
-        if not isinstance(text, str):
-            print(f"❌ Ошибка: ожидалась строка, получен {type(text)}")
-            return None
-
-        # Проверяем, если это уже Python словарь (repr format)
-        if text.startswith('{') and text.endswith('}'):
-            try:
-                # Пытаемся распарсить как Python литерал
-                result = ast.literal_eval(text)
-                # Обрабатываем bytes объекты в результате
-                if isinstance(result, dict):
-                    processed_result = {}
-                    for key, value in result.items():
-                        if isinstance(value, bytes):
-                            # Декодируем bytes в строку
-                            processed_result[key] = value.decode('utf-8', errors='ignore')
-                        else:
-                            processed_result[key] = value
-                    return processed_result
-                return result
-            except (ValueError, SyntaxError) as e:
-                print(f"❌ Ошибка парсинга Python литерала: {e}")
-                pass
-
-        # Универсальный подход - обрабатываем все проблемные символы пошагово
-
-        # 1. Сначала экранируем все кавычки в строковых значениях
-        # Ищем паттерн: "key": "value"with"quotes"inside"
-        # Заменяем на: "key": "value\"with\"quotes\"inside"
-
-        def fix_quotes_in_strings(match):
-            key = match.group(1)
-            value = match.group(2)
-            # Экранируем все кавычки внутри значения
-            escaped_value = value.replace('"', '\\"')
-            return f'"{key}": "{escaped_value}"'
-
-        # Ищем строки вида: "key": "value"with"quotes"
-        fixed_text = re.sub(r'"([^"]+)":\s*"([^"]*)"([^"]*)"', fix_quotes_in_strings, text)
-
-        # 2. Экранируем контрольные символы
-        fixed_text = fixed_text.replace('\n', '\\n')
-        fixed_text = fixed_text.replace('\r', '\\r')
-        fixed_text = fixed_text.replace('\t', '\\t')
-        fixed_text = fixed_text.replace('\x00', '\\u0000')
-
-        # 3. Обрабатываем остальные замены
-        fixed_text = fixed_text.replace("'", '"')
-        fixed_text = fixed_text.replace('True', 'true')
-        fixed_text = fixed_text.replace('False', 'false')
-        fixed_text = fixed_text.replace('None', 'null')
-
-        # 4. Добавляем кавычки вокруг ключей, если они не заключены в кавычки
-        fixed_text = re.sub(r'([a-zA-Z_][a-zA-Z0-9_.]*):', r'"\1":', fixed_text)
-
-        try:
-            return json.loads(fixed_text)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON: {e}")
-            print(f"Problematic text: {text}")
-            print(f"Fixed text: {fixed_text}")
-
-            # Fallback к ast.literal_eval если JSON парсинг не удался
-            try:
-                ast_text = fixed_text.replace('"', "'")
-                return ast.literal_eval(ast_text)
-            except (ValueError, SyntaxError) as ast_e:
-                print(f"ast.literal_eval also failed: {ast_e}")
-                return None
+        self.rows = RowMapper()
+        self.ids = IdAllocator(self.db_adapter)
+        self.user_state = UserStateCache.shared()
+        # позиции чтения пишутся пакетами, если включен write-behind
+        self.positions = PositionWriteBuffer.shared() if config.position_write_behind else None
 
     def str_to_bool(self, value):
         return value.lower() in ('true', 't', 'yes', 'y', '1')
@@ -91,19 +266,20 @@ class DbManager:
     def bool_to_str(self, value):
         return str(value).lower()
 
-    def _execute_parameterized_query(self, query, parameters=None):
+    def _execute_parameterized_query(self, query, parameters=None, name=None):
         """
         Выполняет параметризованный запрос к YDB
 
         Args:
             query: SQL запрос с параметрами вида $param_name
             parameters: Словарь параметров {'$param_name': value}
+            name: Имя запроса для метрик, обычно 'DbManager.<метод>'
 
         Returns:
             Результат выполнения запроса или None в случае ошибки
         """
         try:
-            result = self.db_adapter.execute_query(query, parameters)
+            result = self.db_adapter.execute_query(query, parameters, name=name)
             return result
         except Exception as e:
             print(f"Error executing parameterized query: {str(e)}")
@@ -112,103 +288,59 @@ class DbManager:
             return None
 
     def update_book_pos(self, user_id, book_id, newpos):
-        query = """
-            DECLARE $user_id AS Uint64;
-            DECLARE $book_id AS Uint64;
-            DECLARE $newpos AS Uint64;
-
-            UPDATE user_books
-            SET pos = $newpos
-            WHERE userId = $user_id AND bookId = $book_id;
-        """
-        return self._execute_parameterized_query(query, {
+        if self.positions is not None:
+            self.positions.discard(user_id, book_id)
+        query = self.update_book_pos_query
+        result = self._execute_parameterized_query(query, {
             '$user_id': user_id,
             '$book_id': book_id,
             '$newpos': newpos
-        })
+        }, name='DbManager.update_book_pos')
+        if result is None:
+            self.user_state.invalidate(user_id, 'current_book')
+        else:
+            self.user_state.update_pos(user_id, book_id, newpos)
+        return result
 
     def update_current_book(self, user_id, book_id):
         print(f"🔄 update_current_book: user_id={user_id}, book_id={book_id}")
 
-        # Деактивируем предыдущую активную книгу пользователя
-        deactivate_query = """
-            DECLARE $user_id AS Uint64;
-
-            UPDATE user_books
-            SET isActive = false
-            WHERE userId = $user_id AND isActive = true;
-        """
-        self._execute_parameterized_query(deactivate_query, {'$user_id': user_id})
-        print(f"✅ Деактивированы предыдущие активные книги")
-
-        # Активируем новую книгу
-        # Сначала проверяем, существует ли запись
-        check_query = """
+        # Одним запросом: выбранная книга становится активной, остальные книги
+        # пользователя - неактивными. Если записи user_books для книги нет, она создается.
+        # Чтение и запись в одном выражении, поэтому транзакция одна
+        query = """
+            DECLARE $id AS Uint64;
             DECLARE $user_id AS Uint64;
             DECLARE $book_id AS Uint64;
 
-            SELECT id FROM user_books
-            WHERE userId = $user_id AND bookId = $book_id;
+            $user_books = (
+                SELECT id, userId, bookId, pos, mode
+                FROM user_books
+                WHERE userId = $user_id
+            );
+
+            $has_book = (SELECT COUNT(*) FROM $user_books WHERE bookId = $book_id) > 0;
+
+            UPSERT INTO user_books (id, userId, bookId, isActive, pos, mode)
+            SELECT id, userId, bookId, bookId = $book_id AS isActive, pos, mode
+            FROM $user_books
+            UNION ALL
+            SELECT $id AS id, $user_id AS userId, $book_id AS bookId,
+                   true AS isActive, 0ul AS pos, 'normal'u AS mode
+            FROM AS_TABLE(AsList(AsStruct(1 AS one)))
+            WHERE NOT $has_book;
         """
-        result = self._execute_parameterized_query(check_query, {
+        # id нужен только для новой записи, но берется из уже выданного блока без запроса к БД;
+        # неиспользованный id - просто пропуск в нумерации
+        result = self._execute_parameterized_query(query, {
+            '$id': self.ids.next_id('user_books'),
             '$user_id': user_id,
             '$book_id': book_id
-        })
-
-        if result and len(result[0].rows) > 0:
-            # Запись существует, обновляем её
-            print(f"✅ Запись user_books существует, обновляем")
-            update_query = """
-                DECLARE $user_id AS Uint64;
-                DECLARE $book_id AS Uint64;
-
-                UPDATE user_books
-                SET isActive = true
-                WHERE userId = $user_id AND bookId = $book_id;
-            """
-            self._execute_parameterized_query(update_query, {
-                '$user_id': user_id,
-                '$book_id': book_id
-            })
-            print(f"✅ Книга {book_id} активирована для пользователя {user_id}")
-        else:
-            # Записи нет, создаем новую с уникальным id
-            print(f"📝 Запись user_books не существует, создаем новую")
-            # Получаем максимальный ID из таблицы user_books
-            max_id_query = "SELECT MAX(id) as max_id FROM user_books;"
-            max_result = self.db_adapter.execute_query(max_id_query)
-
-            next_id = 1  # По умолчанию
-            if max_result and len(max_result[0].rows) > 0:
-                try:
-                    max_data = self._text_to_json(str(max_result[0].rows[0]))
-                    max_id = max_data.get('max_id')
-                    if max_id is not None:
-                        next_id = int(max_id) + 1
-                except Exception as e:
-                    print(f"⚠️ Ошибка получения max_id для user_books: {e}")
-                    try:
-                        raw_max_id = max_result[0].rows[0][0]
-                        if raw_max_id is not None:
-                            next_id = int(raw_max_id) + 1
-                    except Exception as e2:
-                        print(f"⚠️ Ошибка получения max_id (способ 2): {e2}")
-
-            insert_query = """
-                DECLARE $id AS Uint64;
-                DECLARE $user_id AS Uint64;
-                DECLARE $book_id AS Uint64;
-
-                INSERT INTO user_books (id, userId, bookId, isActive, pos, mode)
-                VALUES ($id, $user_id, $book_id, true, 0, 'normal');
-            """
-            self._execute_parameterized_query(insert_query, {
-                '$id': next_id,
-                '$user_id': user_id,
-                '$book_id': book_id
-            })
-            print(f"✅ Создана новая запись user_books с id={next_id}")
-
+        }, name='DbManager.update_current_book')
+        self.user_state.invalidate(user_id, 'current_book')
+        if result is None:
+            return -1
+        print(f"✅ Книга {book_id} активирована для пользователя {user_id}")
         return 0
 
     def update_auto_status(self, user_id, status_to):
@@ -219,9 +351,11 @@ class DbManager:
         check_query = """
             DECLARE $user_id AS Uint64;
 
-            SELECT userId FROM users WHERE userId = $user_id;
+            SELECT userId, time FROM users WHERE userId = $user_id;
         """
-        result = self._execute_parameterized_query(check_query, {'$user_id': user_id})
+        result = self._execute_parameterized_query(check_query, {'$user_id': user_id},
+                                                   name='DbManager.update_auto_status.check')
+        old_time = self.rows.scalar(result, 'time', '')
 
         if result and len(result[0].rows) > 0:
             # Пользователь существует, обновляем
@@ -233,31 +367,13 @@ class DbManager:
                 SET isAutoSend = $is_auto_send
                 WHERE userId = $user_id;
             """
-            self._execute_parameterized_query(query, {
+            result = self._execute_parameterized_query(query, {
                 '$user_id': user_id,
                 '$is_auto_send': status_to
-            })
+            }, name='DbManager.update_auto_status.update')
         else:
             # Пользователя нет, создаем с уникальным числовым id
-            # Получаем максимальный ID из таблицы users
-            max_id_query = "SELECT MAX(id) as max_id FROM users;"
-            max_result = self.db_adapter.execute_query(max_id_query)
-
-            next_id = 1  # По умолчанию
-            if max_result and len(max_result[0].rows) > 0:
-                try:
-                    max_data = self._text_to_json(str(max_result[0].rows[0]))
-                    max_id = max_data.get('max_id')
-                    if max_id is not None:
-                        next_id = int(max_id) + 1
-                except Exception as e:
-                    print(f"⚠️ Ошибка получения max_id для users: {e}")
-                    try:
-                        raw_max_id = max_result[0].rows[0][0]
-                        if raw_max_id is not None:
-                            next_id = int(raw_max_id) + 1
-                    except Exception as e2:
-                        print(f"⚠️ Ошибка получения max_id (способ 2): {e2}")
+            next_id = self.ids.next_id('users')
 
             query = """
                 DECLARE $id AS Uint64;
@@ -267,12 +383,18 @@ class DbManager:
                 INSERT INTO users (id, userId, isAutoSend)
                 VALUES ($id, $user_id, $is_auto_send);
             """
-            self._execute_parameterized_query(query, {
+            result = self._execute_parameterized_query(query, {
                 '$id': next_id,
                 '$user_id': user_id,
                 '$is_auto_send': status_to
-            })
-
+            }, name='DbManager.update_auto_status.insert')
+
+        if result is None:
+            # статус в БД не изменился - кэш не должен его подменять
+            self.user_state.invalidate(user_id, 'auto_send')
+            return -1
+        self._sync_schedule(user_id, old_time)
+        self.user_state.set(user_id, auto_send=bool(status_to))
         return 0
 
     def update_user_lang(self, user_id, lang):
@@ -284,7 +406,8 @@ class DbManager:
 
             SELECT userId FROM users WHERE userId = $user_id;
         """
-        result = self._execute_parameterized_query(check_query, {'$user_id': user_id})
+        result = self._execute_parameterized_query(check_query, {'$user_id': user_id},
+                                                   name='DbManager.update_user_lang.check')
 
         if result and len(result[0].rows) > 0:
             # Пользователь существует, обновляем
@@ -296,31 +419,13 @@ class DbManager:
                 SET lang = $lang
                 WHERE userId = $user_id;
             """
-            self._execute_parameterized_query(query, {
+            result = self._execute_parameterized_query(query, {
                 '$user_id': user_id,
                 '$lang': lang
-            })
+            }, name='DbManager.update_user_lang.update')
         else:
             # Пользователя нет, создаем с уникальным числовым id
-            # Получаем максимальный ID из таблицы users
-            max_id_query = "SELECT MAX(id) as max_id FROM users;"
-            max_result = self.db_adapter.execute_query(max_id_query)
-
-            next_id = 1  # По умолчанию
-            if max_result and len(max_result[0].rows) > 0:
-                try:
-                    max_data = self._text_to_json(str(max_result[0].rows[0]))
-                    max_id = max_data.get('max_id')
-                    if max_id is not None:
-                        next_id = int(max_id) + 1
-                except Exception as e:
-                    print(f"⚠️ Ошибка получения max_id для users: {e}")
-                    try:
-                        raw_max_id = max_result[0].rows[0][0]
-                        if raw_max_id is not None:
-                            next_id = int(raw_max_id) + 1
-                    except Exception as e2:
-                        print(f"⚠️ Ошибка получения max_id (способ 2): {e2}")
+            next_id = self.ids.next_id('users')
 
             query = """
                 DECLARE $id AS Uint64;
@@ -330,15 +435,24 @@ class DbManager:
                 INSERT INTO users (id, userId, lang)
                 VALUES ($id, $user_id, $lang);
             """
-            self._execute_parameterized_query(query, {
+            result = self._execute_parameterized_query(query, {
                 '$id': next_id,
                 '$user_id': user_id,
                 '$lang': lang
-            })
+            }, name='DbManager.update_user_lang.insert')
 
+        if result is None:
+            # язык в БД не изменился - кэш не должен его подменять
+            self.user_state.invalidate(user_id, 'lang')
+            return -1
+        self.user_state.set(user_id, lang=lang)
         return 0
 
     def get_current_book(self, user_id):
+        cached = self.user_state.get(user_id, 'current_book')
+        if cached is not None:
+            return cached
+
         query = """
             DECLARE $user_id AS Uint64;
 
@@ -348,27 +462,33 @@ class DbManager:
             WHERE ub.userId = $user_id
             AND ub.isActive = true;
         """
-        result = self._execute_parameterized_query(query, {'$user_id': user_id})
+        result = self._execute_parameterized_query(query, {'$user_id': user_id}, name='DbManager.get_current_book')
         print(f"get_current_book. result: {result}")
         if not result or len(result[0].rows) == 0:
             return None, None, None, None
-        data = self._text_to_json(str(result[0].rows[0]))
-        # todo: перед возвратом сделать модель Book
-        return data['ub.bookId'], data['b.bookName'], data['ub.pos'], data['ub.mode']
+        book = self.rows.to_book(result[0].rows[0], id_column='ub.bookId', name_column='b.bookName',
+                                 pos_column='ub.pos', mode_column='ub.mode')
+        pos = self._pending_pos(user_id, book.id, book.pos)
+        self.user_state.set(user_id, current_book=(book.id, book.name, pos, book.mode))
+        return book.id, book.name, pos, book.mode
 
     def get_auto_status(self, user_id):
         # return status of auto-sending
+        cached = self.user_state.get(user_id, 'auto_send')
+        if cached is not None:
+            return cached
+
         query = """
             DECLARE $user_id AS Uint64;
 
             SELECT isAutoSend FROM users
             WHERE userId = $user_id;
         """
-        result = self._execute_parameterized_query(query, {'$user_id': user_id})
-        if len(result[0].rows) == 1:
-            data = self._text_to_json(str(result[0].rows[0]))
-            status = self.str_to_bool(data['isAutoSend'])
-            return status
+        result = self._execute_parameterized_query(query, {'$user_id': user_id}, name='DbManager.get_auto_status')
+        if len(self.rows.rows(result)) == 1:
+            auto_send = bool(self.rows.scalar(result, 'isAutoSend', False))
+            self.user_state.set(user_id, auto_send=auto_send)
+            return auto_send
         return -1
 
     def get_user_books(self, user_id):
@@ -382,14 +502,13 @@ class DbManager:
             WHERE ub.userId = $user_id;
         """
 
-        result = self._execute_parameterized_query(query, {'$user_id': user_id})
+        result = self._execute_parameterized_query(query, {'$user_id': user_id}, name='DbManager.get_user_books')
 
         user_books = {}
 
-        for row in result[0].rows:
-            data = self._text_to_json(str(row))
-            book_id = data['bookId']
-            book_name = data['bookName']
+        for row in self.rows.rows(result):
+            book_id = self.rows.value(row, 'bookId')
+            book_name = self.rows.value(row, 'bookName')
             user_books[book_name] = book_id
 
         return user_books
@@ -401,14 +520,12 @@ class DbManager:
             SELECT userId FROM users
             WHERE isAutoSend = true;
         """
-        result = self._execute_parameterized_query(query)
+        result = self._execute_parameterized_query(query, name='DbManager.get_users_for_autosend')
 
         user_ids = []
 
-        for row in result[0].rows:
-            data = self._text_to_json(row)
-            user_id = data['userId']
-            user_ids.append(user_id)
+        for row in self.rows.rows(result):
+            user_ids.append(self.rows.value(row, 'userId'))
 
         return user_ids
 
@@ -424,29 +541,33 @@ class DbManager:
         result = self._execute_parameterized_query(query, {
             '$user_id': user_id,
             '$book_id': book_id
-        })
-        if len(result[0].rows) == 1:
-            data = self._text_to_json(str(result[0].rows[0]))
-            book_id = data['bookId']
-            book_pos = data['pos']
-            return book_id, book_pos
+        }, name='DbManager.get_book_pos')
+        if len(self.rows.rows(result)) == 1:
+            row = self.rows.first(result)
+            return self.rows.value(row, 'bookId'), self._pending_pos(user_id, book_id, self.rows.value(row, 'pos'))
         return -1
 
+    def _pending_pos(self, user_id, book_id, pos):
+        # позиция, еще не записанная в БД (write-behind), иначе pos из БД
+        if self.positions is None:
+            return pos
+        pending = self.positions.pending(user_id, book_id)
+        return pos if pending is None else pending
+
 
     def get_user_lang(self, user_id):
         # Return lang for user
-        query = """
-            DECLARE $user_id AS Uint64;
+        cached = self.user_state.get(user_id, 'lang')
+        if cached is not None:
+            return cached
 
-            SELECT lang FROM users
-            WHERE userId = $user_id;
-        """
+        query = self.get_user_lang_query
 
-        result = self._execute_parameterized_query(query, {'$user_id': user_id})
+        result = self._execute_parameterized_query(query, {'$user_id': user_id}, name='DbManager.get_user_lang')
 
-        if len(result[0].rows) == 1:
-            data = self._text_to_json(str(result[0].rows[0]))
-            lang = data['lang']
+        if len(self.rows.rows(result)) == 1:
+            lang = self.rows.scalar(result, 'lang')
+            self.user_state.set(user_id, lang=lang)
             return lang
         return None
 
@@ -459,6 +580,10 @@ class DbManager:
 
             INSERT INTO book_chunks (bookId, chunkId, text)
             VALUES ($book_id, $chunk_id, $text);
+
+            UPSERT INTO books (id, chunkCount)
+            SELECT id, MAX_OF(COALESCE(chunkCount, 0ul), $chunk_id + 1ul) AS chunkCount
+            FROM books WHERE id = $book_id;
         """
 
         try:
@@ -466,38 +591,43 @@ class DbManager:
                 '$book_id': book_id,
                 '$chunk_id': chunk_id,
                 '$text': text
-            })
+            }, name='DbManager.save_chunk')
             return 0
         except Exception as e:
             print(f"❌ Ошибка сохранения чанка {chunk_id} для книги {book_id}: {e}")
             raise e
 
-    def save_chunks_batch(self, book_id, chunks_list):
+    def save_chunks_batch(self, book_id, chunks_list, batch_size=None):
         """
         БАТЧИНГ: Сохраняем множество чанков
-        Использует параметризованные запросы для безопасности
+        Каждый батч уходит одним запросом с параметром List<Struct>:
+        номера чанков считаются от books.chunkCount, и счетчик сдвигается
+        в той же транзакции
+
+        Returns:
+            int: Количество записанных чанков
         """
         if not chunks_list:
             return 0
 
-        # Получаем текущее количество чанков ОДИН РАЗ
-        current_chunk_count = self.get_total_chunks(book_id)
+        batch_size = batch_size or config.chunks_batch_size
 
-        # YDB не поддерживает массовые параметризованные вставки напрямую
-        # Поэтому используем отдельные параметризованные INSERT'ы
-        # Это безопаснее, чем старый батчинг с конкатенацией строк
+        query = self.save_chunks_batch_query
 
         chunks_created = 0
-        print(f"🚀 БАТЧИНГ: Сохраняем {len(chunks_list)} чанков параметризованными запросами")
-
-        for i, chunk_text in enumerate(chunks_list):
-            try:
-                chunk_id = current_chunk_count + i
-                self.save_chunk(book_id, chunk_id, chunk_text)
-                chunks_created += 1
-            except Exception as e:
-                print(f"❌ Ошибка сохранения чанка {chunk_id}: {e}")
+        print(f"🚀 БАТЧИНГ: Сохраняем {len(chunks_list)} чанков батчами по {batch_size}")
+
+        for start in range(0, len(chunks_list), batch_size):
+            batch = [
+                {'idx': i, 'text': chunk_text}
+                for i, chunk_text in enumerate(chunks_list[start:start + batch_size])
+            ]
+            result = self._execute_parameterized_query(query, {'$book_id': book_id, '$chunks': batch}, name='DbManager.save_chunks_batch')
+            if result is None:
+                print(f"❌ Ошибка сохранения батча из {len(batch)} чанков книги {book_id}")
                 break
+            chunks_created += len(batch)
+            print(f"📦 Записано {len(batch)} чанков одним запросом")
 
         print(f"✅ БАТЧИНГ: Успешно сохранено {chunks_created} чанков")
         return chunks_created
@@ -526,24 +656,116 @@ class DbManager:
         result = self._execute_parameterized_query(query, {
             '$book_id': book_id,
             '$chunk_id': chunk_id
-        })
-        if not result or len(result[0].rows) == 0:
+        }, name='DbManager.get_chunk')
+        return self.rows.scalar(result, 'text')
+
+    def get_chunks_range(self, book_id, first_id, last_id):
+        """
+        Чанки книги с номерами first_id..last_id одним запросом
+
+        Returns:
+            dict: {chunk_id: text}, без чанков, которых еще нет
+        """
+        query = """
+            DECLARE $book_id AS Uint64;
+            DECLARE $first_id AS Uint64;
+            DECLARE $last_id AS Uint64;
+
+            SELECT chunkId, text FROM book_chunks
+            WHERE bookId = $book_id AND chunkId BETWEEN $first_id AND $last_id;
+        """
+        result = self._execute_parameterized_query(query, {
+            '$book_id': book_id,
+            '$first_id': first_id,
+            '$last_id': last_id
+        }, name='DbManager.get_chunks_range')
+        return {
+            self.rows.value(row, 'chunkId'): self.rows.value(row, 'text')
+            for row in self.rows.rows(result)
+        }
+
+    def advance_position(self, user_id):
+        """
+        Сдвигает позицию в текущей книге, не читая текст чанка.
+        Позиция сдвигается, только если чанк на ней уже записан (pos < chunkCount).
+        В режиме write-behind позиция только читается, а новая попадает в PositionWriteBuffer
+
+        Returns:
+            dict: bookId, pos (до сдвига), mode, chunkCount, status, lang
+                  или None, если у пользователя нет активной книги
+        """
+        if self.positions is None:
+            query = self.advance_position_query
+        else:
+            query = self.read_position_query
+        result = self._execute_parameterized_query(query, {'$user_id': user_id}, name='DbManager.advance_position')
+        row = self.rows.first(result)
+        if row is None:
             return None
-        data = self._text_to_json(str(result[0].rows[0]))
-        return data['text']
+        state = self.rows.to_dict(row, ['bookId', 'pos', 'mode', 'chunkCount', 'status', 'lang'])
+        state['pos'] = self._pending_pos(user_id, state['bookId'], state['pos'])
+        self.user_state.set(user_id, lang=state['lang'])
+        if state['chunkCount'] is not None and state['pos'] < state['chunkCount']:
+            if self.positions is not None:
+                self.positions.put(user_id, state['bookId'], state['pos'] + 1)
+            self.user_state.update_pos(user_id, state['bookId'], state['pos'] + 1)
+        return state
+
+    def read_next_chunk(self, user_id):
+        """
+        Читает чанк текущей книги пользователя и сдвигает позицию - один запрос к YDB
+
+        Returns:
+            dict: book_id, mode, text, lang, pos (новая позиция), end_of_book
+                  или None, если у пользователя нет активной книги
+        """
+        if self.positions is not None and len(self.positions):
+            # позиция сдвигается в БД - сначала записываем отложенные
+            self.positions.flush()
+        query = self.read_next_chunk_query
+        result = self._execute_parameterized_query(query, {'$user_id': user_id}, name='DbManager.read_next_chunk')
+        portion = self.rows.to_portion(self.rows.first(result))
+        if portion is not None:
+            self.user_state.set(user_id, lang=portion['lang'])
+            self.user_state.update_pos(user_id, portion['book_id'], portion['pos'])
+        return portion
 
     def get_total_chunks(self, book_id):
         query = """
             DECLARE $book_id AS Uint64;
 
-            SELECT COUNT(*) as count FROM book_chunks
-            WHERE bookId = $book_id;
+            SELECT chunkCount FROM books
+            WHERE id = $book_id;
         """
-        result = self._execute_parameterized_query(query, {'$book_id': book_id})
-        if len(result[0].rows) == 0:
-            return 0
-        data = self._text_to_json(str(result[0].rows[0]))
-        return data['count']
+        result = self._execute_parameterized_query(query, {'$book_id': book_id}, name='DbManager.get_total_chunks')
+        chunk_count = self.rows.scalar(result, 'chunkCount')
+        if chunk_count is None:
+            # книга добавлена до появления chunkCount - считаем один раз и сохраняем
+            chunk_count = self._count_chunks(book_id)
+        return chunk_count
+
+    def _count_chunks(self, book_id):
+        query = """
+            DECLARE $book_id AS Uint64;
+
+            $count = (SELECT COUNT(*) FROM book_chunks WHERE bookId = $book_id);
+
+            UPSERT INTO books (id, chunkCount)
+            VALUES ($book_id, $count);
+
+            SELECT $count AS count;
+        """
+        result = self._execute_parameterized_query(query, {'$book_id': book_id}, name='DbManager._count_chunks')
+        return self.rows.scalar(result, 'count', 0)
+
+    def update_book_status(self, book_id, status):
+        # status of book processing: 'processing' while chunks are added, then 'ready' ('failed' if loading broke)
+        query = self.update_book_status_query
+        self._execute_parameterized_query(query, {
+            '$book_id': book_id,
+            '$status': status
+        }, name='DbManager.update_book_status')
+        return 0
 
 
     def update_book_mode(self, user_id, book_id, mode):
@@ -561,7 +783,8 @@ class DbManager:
             '$user_id': user_id,
             '$book_id': book_id,
             '$mode': mode
-        })
+        }, name='DbManager.update_book_mode')
+        self.user_state.invalidate(user_id, 'current_book')
         return 0
 
 
@@ -580,44 +803,19 @@ class DbManager:
             WHERE bookName = $book_name;
         """
         print(f"🔍 Выполняем параметризованный запрос поиска книги")
-        result = self._execute_parameterized_query(query, {'$book_name': book_name})
+        result = self._execute_parameterized_query(query, {'$book_name': book_name}, name='DbManager.get_or_create_book.find')
         print(f"🔍 Результат поиска: {result}")
 
         if result and len(result[0].rows) > 0:
             # Book exists, return its ID
-            print(f"✅ Книга найдена, извлекаем ID...")
-            print(f"🔍 Сырой результат: {result[0].rows[0]}")
-            print(f"🔍 Строковое представление: {str(result[0].rows[0])}")
-
-            # Пробуем разные способы извлечения ID
-            try:
-                # Способ 1: через _text_to_json
-                data = self._text_to_json(str(result[0].rows[0]))
-                print(f"🔍 Распарсенные данные: {data}")
-                book_id = data.get('id')
-                if book_id is not None:
-                    print(f"✅ ID найденной книги (способ 1): {book_id}")
-                    return int(book_id)
-                else:
-                    print(f"⚠️ ID книги в БД равен NULL - это ошибка данных!")
-            except Exception as e:
-                print(f"⚠️ Способ 1 не сработал: {e}")
-
-            try:
-                # Способ 2: прямое извлечение из результата
-                raw_id = result[0].rows[0][0]  # Первый столбец первой строки
-                print(f"🔍 Прямой ID: {raw_id}")
-                if raw_id is not None:
-                    book_id = int(raw_id)
-                    print(f"✅ ID найденной книги (способ 2): {book_id}")
-                    return book_id
-                else:
-                    print(f"⚠️ ID книги в БД равен NULL - это ошибка данных!")
-            except Exception as e:
-                print(f"⚠️ Способ 2 не сработал: {e}")
+            book_id = self.rows.scalar(result, 'id')
+            if book_id is not None:
+                print(f"✅ ID найденной книги: {book_id}")
+                return int(book_id)
 
             # Если книга найдена, но ID = NULL, это критическая ошибка данных
             # Удаляем битую запись и создаем новую
+            print(f"⚠️ ID книги в БД равен NULL - это ошибка данных!")
             print(f"🔧 Удаляем битую запись с NULL id...")
             delete_query = """
                 DECLARE $book_name AS Utf8;
@@ -625,70 +823,46 @@ class DbManager:
                 DELETE FROM books
                 WHERE bookName = $book_name AND id IS NULL;
             """
-            self._execute_parameterized_query(delete_query, {'$book_name': book_name})
+            self._execute_parameterized_query(delete_query, {'$book_name': book_name}, name='DbManager.get_or_create_book.delete')
             print(f"✅ Битая запись удалена, создаем новую...")
-            # Продолжаем создание новой записи ниже
         else:
             # Book doesn't exist, create new one
             print(f"📝 Книга не найдена, создаем новую...")
 
-            # Get the next available ID by finding the maximum existing ID
-            max_id_query = """
-                SELECT MAX(id) as max_id FROM books;
-            """
-            print(f"🔍 Получаем максимальный ID: {max_id_query}")
-            max_result = self.db_adapter.execute_query(max_id_query)
-            print(f"🔍 Результат максимального ID: {max_result}")
+        # Get the next available ID
+        next_id = self.ids.next_id('books')
+        print(f"📝 Следующий ID: {next_id}")
 
-            next_id = 1  # По умолчанию
-
-            if max_result and len(max_result[0].rows) > 0:
-                try:
-                    # Способ 1: через _text_to_json
-                    max_data = self._text_to_json(str(max_result[0].rows[0]))
-                    max_id = max_data.get('max_id')
-                    if max_id is not None:
-                        next_id = int(max_id) + 1
-                except Exception as e:
-                    print(f"⚠️ Способ 1 для max_id не сработал: {e}")
-                    try:
-                        # Способ 2: прямое извлечение
-                        raw_max_id = max_result[0].rows[0][0]
-                        if raw_max_id is not None:
-                            next_id = int(raw_max_id) + 1
-                    except Exception as e2:
-                        print(f"⚠️ Способ 2 для max_id не сработал: {e2}")
-
-            print(f"📝 Следующий ID: {next_id}")
-
-            # Insert new book with the calculated ID using parameterized query
-            insert_query = """
-                DECLARE $book_id AS Uint64;
-                DECLARE $book_name AS Utf8;
-                DECLARE $hash AS Utf8;
+        # Insert new book with the calculated ID using parameterized query
+        insert_query = """
+            DECLARE $book_id AS Uint64;
+            DECLARE $book_name AS Utf8;
+            DECLARE $hash AS Utf8;
 
-                INSERT INTO books (id, bookName, hash)
-                VALUES ($book_id, $book_name, $hash);
-            """
-            print(f"📝 Выполняем параметризованный INSERT")
-            self._execute_parameterized_query(insert_query, {
-                '$book_id': next_id,
-                '$book_name': book_name,
-                '$hash': ""
-            })
-            print(f"✅ INSERT выполнен")
+            INSERT INTO books (id, bookName, hash, chunkCount, status)
+            VALUES ($book_id, $book_name, $hash, 0ul, 'processing'u);
+        """
+        print(f"📝 Выполняем параметризованный INSERT")
+        self._execute_parameterized_query(insert_query, {
+            '$book_id': next_id,
+            '$book_name': book_name,
+            '$hash': ""
+        }, name='DbManager.get_or_create_book.insert')
+        print(f"✅ INSERT выполнен")
 
-            print(f"✅ ID созданной книги: {next_id}")
-            return next_id
+        print(f"✅ ID созданной книги: {next_id}")
+        return next_id
 
     def update_user_time(self, user_id, time_str):
         """Обновляет время автопересылки для пользователя"""
         check_query = """
             DECLARE $user_id AS Uint64;
 
-            SELECT userId FROM users WHERE userId = $user_id;
+            SELECT userId, time FROM users WHERE userId = $user_id;
         """
-        result = self._execute_parameterized_query(check_query, {'$user_id': user_id})
+        result = self._execute_parameterized_query(check_query, {'$user_id': user_id},
+                                                   name='DbManager.update_user_time.check')
+        old_time = self.rows.scalar(result, 'time', '')
 
         if result and len(result[0].rows) > 0:
             query = """
@@ -702,27 +876,10 @@ class DbManager:
             self._execute_parameterized_query(query, {
                 '$user_id': user_id,
                 '$time': time_str
-            })
+            }, name='DbManager.update_user_time.update')
         else:
             # Пользователя нет, создаем с уникальным числовым id
-            max_id_query = "SELECT MAX(id) as max_id FROM users;"
-            max_result = self.db_adapter.execute_query(max_id_query)
-
-            next_id = 1  # По умолчанию
-            if max_result and len(max_result[0].rows) > 0:
-                try:
-                    max_data = self._text_to_json(str(max_result[0].rows[0]))
-                    max_id = max_data.get('max_id')
-                    if max_id is not None:
-                        next_id = int(max_id) + 1
-                except Exception as e:
-                    print(f"⚠️ Ошибка получения max_id для users: {e}")
-                    try:
-                        raw_max_id = max_result[0].rows[0][0]
-                        if raw_max_id is not None:
-                            next_id = int(raw_max_id) + 1
-                    except Exception as e2:
-                        print(f"⚠️ Ошибка получения max_id (способ 2): {e2}")
+            next_id = self.ids.next_id('users')
 
             query = """
                 DECLARE $id AS Uint64;
@@ -736,10 +893,194 @@ class DbManager:
                 '$id': next_id,
                 '$user_id': user_id,
                 '$time': time_str
-            })
+            }, name='DbManager.update_user_time.insert')
 
+        self._sync_schedule(user_id, old_time)
+        self.user_state.set(user_id, time=time_str)
         return 0
 
+    def _sync_schedule(self, user_id, old_time):
+        # строка пользователя в auto_send_schedule после изменения времени или статуса автопересылки
+        self._execute_parameterized_query(self.sync_schedule_query, {
+            '$user_id': user_id,
+            '$old_time': old_time or ''
+        }, name='DbManager._sync_schedule')
+
+    def delivery_slot(self, current_time):
+        # key of slot in delivery_ledger and auto_send_runs: 'YYYY-MM-DD HH:MM'
+        return current_time.strftime('%Y-%m-%d %H:%M')
+
+    def iter_due_delivery_pages(self, slot, page_size=None, shard=0, shards=1, after_user_id=0):
+        """
+        Страницы доставок слота slot ('YYYY-MM-DD HH:MM') для пользователей шарда (userId % shards == shard),
+        начиная после after_user_id. Каждая страница - список [{user_id, chat_id, lang, time, portion}],
+        None - страницу прочитать не удалось (дальше страниц нет). Следующая страница читается,
+        когда вызывающий закончил с предыдущей.
+        Пользователи, уже отмеченные в delivery_ledger для этого слота, пропускаются
+        """
+        page_size = page_size or config.due_deliveries_page_size
+        if self.positions is not None:
+            # позиции из буфера должны быть в БД до чтения чанков
+            self.positions.flush()
+
+        last_user_id = after_user_id
+        while True:
+            result = self._execute_parameterized_query(self.claim_due_deliveries_query, {
+                '$current_time': slot[-5:],
+                '$last_user_id': last_user_id,
+                '$limit': page_size,
+                '$shard': shard,
+                '$shards': shards,
+                '$delivery_slot': slot,
+                '$claim_before': int(time.time()) - config.delivery_claim_timeout,
+                '$now': int(time.time())
+            }, name='DbManager.iter_due_delivery_pages')
+            if result is None:
+                yield None
+                return
+            rows = self.rows.rows(result)
+            page = []
+            for row in rows:
+                if self.rows.value(row, 'ledgerStatus') is not None:
+                    # уже доставлен или доставляется другим обработчиком
+                    continue
+                page.append(self.rows.to_due_delivery(row))
+            if page:
+                yield page
+            scan = self.rows.first(result, 1)
+            if self.rows.value(scan, 'scanned', 0) < page_size:
+                return
+            last_user_id = self.rows.value(scan, 'lastUserId')
+
+    def finish_deliveries(self, slot, sent_user_ids, failed):
+        """
+        Отмечает результат доставок слота в delivery_ledger
+
+        Args:
+            slot: Слот 'YYYY-MM-DD HH:MM'
+            sent_user_ids: ID пользователей, которым чанк отправлен: их позиция сдвигается за него
+            failed: Доставки (как у iter_due_delivery_pages), которые не удалось отправить:
+                    строка ledger удаляется, позиция остается на том же чанке
+        """
+        if sent_user_ids:
+            self._execute_parameterized_query(self.mark_deliveries_sent_query, {
+                '$delivery_slot': slot,
+                '$user_ids': list(sent_user_ids),
+                '$now': int(time.time())
+            }, name='DbManager.finish_deliveries.mark_sent')
+            for user_id in sent_user_ids:
+                self.user_state.invalidate(user_id, 'current_book')
+        if not failed:
+            return
+        self._execute_parameterized_query(self.release_deliveries_query, {
+            '$delivery_slot': slot,
+            '$user_ids': [delivery['user_id'] for delivery in failed]
+        }, name='DbManager.finish_deliveries.release')
+
+    def create_auto_send_run(self, slot, shards):
+        """
+        Создает строки auto_send_runs для шардов слота, которых еще нет
+
+        Args:
+            slot: Слот автопересылки 'YYYY-MM-DD HH:MM'
+            shards: Количество шардов
+
+        Returns:
+            list: Номера созданных шардов (пустой, если запуск уже создан), None при ошибке
+        """
+        query = """
+            DECLARE $slot AS Utf8;
+            DECLARE $shards AS List<Struct<shard: Uint64>>;
+            DECLARE $count AS Uint64;
+            DECLARE $now AS Uint64;
+
+            $existing = (SELECT shard FROM auto_send_runs WHERE slot = $slot);
+
+            $new = (
+                SELECT n.shard AS shard
+                FROM AS_TABLE($shards) AS n
+                LEFT ONLY JOIN $existing AS r
+                ON r.shard = n.shard
+            );
+
+            SELECT shard FROM $new;
+
+            UPSERT INTO auto_send_runs (slot, shard, shards, lastUserId, delivered, status, updatedAt)
+            SELECT $slot AS slot, shard, $count AS shards, 0ul AS lastUserId, 0ul AS delivered,
+                   'queued'u AS status, $now AS updatedAt
+            FROM $new;
+        """
+        result = self._execute_parameterized_query(query, {
+            '$slot': slot,
+            '$shards': [{'shard': shard} for shard in range(shards)],
+            '$count': shards,
+            '$now': int(time.time())
+        }, name='DbManager.create_auto_send_run')
+        if result is None:
+            return None
+        return sorted(self.rows.value(row, 'shard') for row in self.rows.rows(result))
+
+    def get_auto_send_run(self, slot, shard):
+        query = """
+            DECLARE $slot AS Utf8;
+            DECLARE $shard AS Uint64;
+
+            SELECT slot, shard, shards, lastUserId, delivered, status, updatedAt
+            FROM auto_send_runs
+            WHERE slot = $slot AND shard = $shard;
+        """
+        result = self._execute_parameterized_query(query, {'$slot': slot, '$shard': shard}, name='DbManager.get_auto_send_run')
+        row = self.rows.first(result)
+        if row is None:
+            return None
+        return self.rows.to_dict(row, ['slot', 'shard', 'shards', 'lastUserId', 'delivered', 'status', 'updatedAt'])
+
+    def checkpoint_auto_send_run(self, slot, shard, last_user_id, delivered, status):
+        # progress of shard: users up to last_user_id are processed
+        query = """
+            DECLARE $slot AS Utf8;
+            DECLARE $shard AS Uint64;
+            DECLARE $last_user_id AS Uint64;
+            DECLARE $delivered AS Uint64;
+            DECLARE $status AS Utf8;
+            DECLARE $now AS Uint64;
+
+            UPSERT INTO auto_send_runs (slot, shard, lastUserId, delivered, status, updatedAt)
+            VALUES ($slot, $shard, $last_user_id, $delivered, $status, $now);
+        """
+        return self._execute_parameterized_query(query, {
+            '$slot': slot,
+            '$shard': shard,
+            '$last_user_id': last_user_id,
+            '$delivered': delivered,
+            '$status': status,
+            '$now': int(time.time())
+        }, name='DbManager.checkpoint_auto_send_run')
+
+    def get_stale_auto_send_runs(self, since_slot, stale_seconds):
+        """
+        Шарды, начиная со слота since_slot, которые не закончены и не обновлялись stale_seconds
+
+        Returns:
+            list: [{slot, shard, shards, lastUserId, delivered, status, updatedAt}]
+        """
+        query = """
+            DECLARE $since_slot AS Utf8;
+            DECLARE $before AS Uint64;
+
+            SELECT slot, shard, shards, lastUserId, delivered, status, updatedAt
+            FROM auto_send_runs
+            WHERE slot >= $since_slot AND status != 'done' AND updatedAt < $before;
+        """
+        result = self._execute_parameterized_query(query, {
+            '$since_slot': since_slot,
+            '$before': int(time.time()) - stale_seconds
+        }, name='DbManager.get_stale_auto_send_runs')
+        return [
+            self.rows.to_dict(row, ['slot', 'shard', 'shards', 'lastUserId', 'delivered', 'status', 'updatedAt'])
+            for row in self.rows.rows(result)
+        ]
+
     def get_users_for_auto_send_by_time(self, current_time):
         """
         Получает пользователей для автопересылки по их предпочтительному времени
@@ -754,28 +1095,15 @@ class DbManager:
         current_time_str = current_time.strftime("%H:%M")
 
         # Получаем всех пользователей с включенной автопересылкой
-        query = """
-            DECLARE $current_time AS Utf8;
-
-            SELECT userId, chatId, lang, time FROM users
-            WHERE isAutoSend = true
-            AND time != ""
-            AND time = $current_time;
-        """
+        query = self.users_for_auto_send_query
 
-        result = self._execute_parameterized_query(query, {'$current_time': current_time_str})
+        result = self._execute_parameterized_query(query, {'$current_time': current_time_str}, name='DbManager.get_users_for_auto_send_by_time')
         users = []
 
         if result and len(result[0].rows) > 0:
             for row in result[0].rows:
                 try:
-                    data = self._text_to_json(str(row))
-                    users.append({
-                        'user_id': data['userId'],
-                        'chat_id': data['chatId'],
-                        'lang': data.get('lang', 'ru'),
-                        'time': data['time']
-                    })
+                    users.append(self.rows.to_auto_send_user(row))
                 except Exception as e:
                     print(f"❌ Ошибка парсинга данных пользователя: {e}")
                     continue
@@ -0,0 +1,185 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+
+class TooManyRequests(Exception):
+    """Telegram answered 429, retry_after - seconds to wait"""
+
+    def __init__(self, retry_after, description=''):
+        super().__init__(f"Too Many Requests: retry after {retry_after}s {description}".strip())
+        self.retry_after = retry_after
+
+
+class TokenBucket(object):
+    """rate tokens per second, at most capacity at once"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        # takes a token, returns seconds to wait until it can be used (0 if available now)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class TelegramRateLimiter(object):
+    """
+    Telegram limits for bots: ~30 messages per second in total
+    and about one message per second in one chat.
+    After 429 all sending is paused for retry_after.
+    """
+
+    def __init__(self, global_rate=None, chat_rate=None):
+        self.global_bucket = TokenBucket(global_rate or config.telegram_global_rate)
+        self.chat_rate = chat_rate or config.telegram_chat_rate
+        self._chat_buckets = {}
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def _chat_bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+            return bucket
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self, chat_id):
+        # blocks until message to chat_id can be sent, returns seconds waited
+        started = time.monotonic()
+        self._chat_bucket(chat_id).acquire()
+        while True:
+            with self._lock:
+                pause = self._paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            time.sleep(pause)
+        self.global_bucket.acquire()
+        return time.monotonic() - started
+
+
+class DeliveryEngine(object):
+    """
+    Delivers to many users at once: every item is processed in a bounded thread pool,
+    sending goes through TelegramRateLimiter with retries after 429
+    """
+
+    def __init__(self, workers=None, limiter=None, max_retries=None):
+        self.workers = workers or config.auto_send_workers
+        self.limiter = limiter or TelegramRateLimiter()
+        self.max_retries = config.telegram_max_retries if max_retries is None else max_retries
+        self._lock = threading.Lock()
+        self.stats = self._new_stats()
+
+    def _new_stats(self):
+        return {
+            'messages_sent': 0,
+            'messages_failed': 0,
+            'retries_429': 0,
+            'rate_wait_seconds': 0.0,
+        }
+
+    @staticmethod
+    def merge_stats(total, stats):
+        """
+        Сумма статистики нескольких вызовов run (например, страниц слота)
+
+        Returns:
+            dict: Общая статистика, messages_per_second пересчитана по общему времени
+        """
+        merged = dict(total)
+        for key, value in stats.items():
+            if key != 'messages_per_second':
+                merged[key] = merged.get(key, 0) + value
+        elapsed = merged.get('elapsed_seconds', 0)
+        merged['elapsed_seconds'] = round(elapsed, 3)
+        merged['rate_wait_seconds'] = round(merged.get('rate_wait_seconds', 0.0), 3)
+        merged['messages_per_second'] = round(merged.get('messages_sent', 0) / elapsed, 2) if elapsed > 0 else 0.0
+        return merged
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def send(self, chat_id, send_once):
+        """
+        Отправляет одно сообщение с учетом лимитов Telegram
+
+        Args:
+            chat_id: ID чата
+            send_once: функция без аргументов, делает один запрос к Telegram
+                       и бросает TooManyRequests на ответ 429
+        """
+        attempt = 0
+        while True:
+            self._count('rate_wait_seconds', self.limiter.acquire(chat_id))
+            try:
+                result = send_once()
+                self._count('messages_sent')
+                return result
+            except TooManyRequests as e:
+                attempt += 1
+                self._count('retries_429')
+                if attempt > self.max_retries:
+                    self._count('messages_failed')
+                    raise
+                print(f"⏳ Telegram просит подождать {e.retry_after}s (чат {chat_id}, попытка {attempt})")
+                self.limiter.pause(e.retry_after)
+            except Exception:
+                self._count('messages_failed')
+                raise
+
+    def run(self, items, deliver):
+        """
+        Обрабатывает items параллельно
+
+        Args:
+            items: Список элементов (например, пользователей)
+            deliver: функция item -> результат, сама вызывает send()
+
+        Returns:
+            tuple: (результаты в порядке items, статистика)
+        """
+        self.stats = self._new_stats()
+        started = time.monotonic()
+
+        def safe_deliver(item):
+            try:
+                return deliver(item)
+            except Exception as e:
+                return {'success': False, 'error': str(e)}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='delivery') as pool:
+            results = list(pool.map(safe_deliver, items))
+
+        elapsed = time.monotonic() - started
+        stats = dict(self.stats)
+        stats['items'] = len(items)
+        stats['elapsed_seconds'] = round(elapsed, 3)
+        stats['messages_per_second'] = round(stats['messages_sent'] / elapsed, 2) if elapsed > 0 else 0.0
+        stats['rate_wait_seconds'] = round(stats['rate_wait_seconds'], 3)
+        return results, stats
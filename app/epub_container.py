@@ -0,0 +1,108 @@
+import posixpath
+import zipfile
+from urllib.parse import unquote
+from lxml import etree
+
+
+class EpubContainer(object):
+    """
+    Lazy EPUB over zipfile: only container.xml and OPF (metadata, manifest, spine)
+    are parsed on open. Documents are decompressed one by one when they are read,
+    images, fonts and styles are never read at all.
+    """
+
+    container_ns = 'urn:oasis:names:tc:opendocument:xmlns:container'
+    opf_ns = 'http://www.idpf.org/2007/opf'
+    dc_ns = 'http://purl.org/dc/elements/1.1/'
+    ncx_ns = 'http://www.daisy.org/z3986/2005/ncx/'
+    document_type = 'application/xhtml+xml'
+
+    def __init__(self, epub_path):
+        self.epub_path = epub_path
+        self.zip = zipfile.ZipFile(epub_path)
+        self.opf_path = self._find_opf()
+        self.opf_dir = posixpath.dirname(self.opf_path)
+        opf = self._parse(self.opf_path)
+        self.title = self._read_title(opf)
+        self.manifest = self._read_manifest(opf)  # id -> {'href', 'media_type', 'properties'}
+        self.spine, self.toc_id = self._read_spine(opf)
+        self._toc = None
+
+    def _find_opf(self):
+        container = self._parse('META-INF/container.xml')
+        for rootfile in container.iter('{%s}rootfile' % self.container_ns):
+            if rootfile.get('media-type') == 'application/oebps-package+xml':
+                return rootfile.get('full-path')
+        raise ValueError(f"OPF not found in {self.epub_path}")
+
+    def _parse(self, name):
+        parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+        return etree.fromstring(self.zip.read(posixpath.normpath(name)), parser)
+
+    def _read_title(self, opf):
+        title = opf.find('{%s}metadata/{%s}title' % (self.opf_ns, self.dc_ns))
+        return title.text if title is not None and title.text else ''
+
+    def _read_manifest(self, opf):
+        manifest = {}
+        for item in opf.iterfind('{%s}manifest/{%s}item' % (self.opf_ns, self.opf_ns)):
+            manifest[item.get('id')] = {
+                'href': unquote(item.get('href', '')),
+                'media_type': item.get('media-type'),
+                'properties': item.get('properties', '').split(),
+            }
+        return manifest
+
+    def _read_spine(self, opf):
+        spine = opf.find('{%s}spine' % self.opf_ns)
+        if spine is None:
+            return [], None
+        idrefs = [itemref.get('idref') for itemref in spine.iterfind('{%s}itemref' % self.opf_ns)]
+        return idrefs, spine.get('toc')
+
+    def document_ids(self):
+        # ids of XHTML documents in manifest order, without EPUB3 navigation document
+        return [item_id for item_id, item in self.manifest.items()
+                if item['media_type'] == self.document_type and 'nav' not in item['properties']]
+
+    def path(self, item_id):
+        # path of manifest item inside the archive
+        return posixpath.normpath(posixpath.join(self.opf_dir, self.manifest[item_id]['href']))
+
+    def open(self, item_id):
+        """
+        Файловый объект с содержимым элемента, распаковывается по мере чтения
+
+        Returns:
+            Файловый объект или None, если элемента нет в manifest или в архиве
+        """
+        if item_id not in self.manifest:
+            return None
+        try:
+            return self.zip.open(self.path(item_id))
+        except KeyError:
+            return None
+
+    def read(self, item_id):
+        stream = self.open(item_id)
+        if stream is None:
+            return None
+        with stream:
+            return stream.read()
+
+    @property
+    def toc(self):
+        # [(title, href)] from NCX, read on first use
+        if self._toc is None:
+            self._toc = []
+            if self.toc_id in self.manifest:
+                ncx = self._parse(self.path(self.toc_id))
+                for point in ncx.iter('{%s}navPoint' % self.ncx_ns):
+                    label = point.find('{%s}navLabel/{%s}text' % (self.ncx_ns, self.ncx_ns))
+                    content = point.find('{%s}content' % self.ncx_ns)
+                    self._toc.append((label.text if label is not None else '',
+                                      unquote(content.get('src', '')) if content is not None else ''))
+        return self._toc
+
+    def close(self):
+        self.zip.close()
@@ -43,6 +43,7 @@ class EpubProcessor(object):
         Returns:
             book_id: ID of the created book in database
         """
+        book_reader = None
         try:
             print(f"📖 Начинаем обработку EPUB: {epub_path}")
             
@@ -124,6 +125,7 @@ class EpubProcessor(object):
                 print(f"⚠️ Достигнуто максимальное количество попыток ({max_attempts}), прерываем обработку")
             
             print(f"✅ Обработка завершена. Обработано блоков: {text_blocks_processed}, создано чанков: {total_chunks_created}, пропущено пустых: {empty_blocks_skipped}")
+            self.db.update_book_status(book_id, 'ready')
             
             # Отправляем финальное сообщение
             self._send_progress_message(bot, chat_id, 
@@ -136,3 +138,6 @@ class EpubProcessor(object):
             import traceback
             print(f"❌ Traceback: {traceback.format_exc()}")
             return None
+        finally:
+            if book_reader is not None:
+                book_reader.close()
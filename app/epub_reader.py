@@ -1,11 +1,6 @@
 import os
-import warnings
-from bs4 import BeautifulSoup as bs, XMLParsedAsHTMLWarning
-import ebooklib
-from ebooklib import epub
-
-# Фильтруем предупреждения о парсинге XML как HTML
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+from epub_container import EpubContainer
+from xhtml_text_extractor import XhtmlTextExtractor
 
 
 class EpubReader():
@@ -13,29 +8,40 @@ class EpubReader():
 
     def __init__(self, epub_path=''):
         self.epub_path = epub_path
+        self.extractor = XhtmlTextExtractor()
+        self.cursor = 0  # index in item_ids of the next item to read
         if epub_path != '':
-            self.book = epub.read_epub(epub_path)
+            # читаются только container.xml и OPF, главы распаковываются по одной при чтении
+            self.book = EpubContainer(epub_path)
             self.spine_ids = self._get_spine_ids()
+            self.spine_index = {item_id: index for index, item_id in enumerate(self.spine_ids)}
             self.item_ids = self._get_item_ids()
             self.item_ids.sort(key=self._sort_by_spine) # sort list of docs ids in order they follow in spine_ids
             print(f"📚 EPUB загружен: {len(self.item_ids)} элементов для обработки")
             print(f"📋 Элементы: {self.item_ids[:10]}{'...' if len(self.item_ids) > 10 else ''}")
         else:
             self.book = None
+            self.spine_ids = []
+            self.spine_index = {}
+            self.item_ids = []
         pass
 
+    def close(self):
+        # close EPUB archive; reader can't read chapters after it
+        if self.book is not None:
+            self.book.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def _get_item_ids(self):
-        item_ids = []
-        doc_item_list = self.book.get_items_of_type(ebooklib.ITEM_DOCUMENT)
-        for elem in doc_item_list:
-            item_ids.append(elem.id)
-        return item_ids
+        return self.book.document_ids()
 
     def _get_spine_ids(self):
-        spine_ids = []
-        for sp in self.book.spine:
-            spine_ids.append(sp[0])
-        return spine_ids
+        return list(self.book.spine)
 
     def get_booktitle(self):
         if self.book is None:
@@ -51,45 +57,38 @@ class EpubReader():
     def _sort_by_spine(self, item):
         # for sorting list of items by list of ids from spine.
         # epub readers read book in spine order
-        if item not in self.spine_ids:
-            return 0
-        return self.spine_ids.index(item)
+        return self.spine_index.get(item, 0)
+
+    def seek(self, item_index):
+        # continue reading from item_ids[item_index], e.g. after restart of processing
+        self.cursor = max(0, min(item_index, len(self.item_ids)))
+
+    def remaining(self):
+        # items not read yet
+        return len(self.item_ids) - self.cursor
 
     def get_next_item_text(self):
         # return text of next item with type ITEM_DOCUMENT
         max_attempts = 100  # Ограничиваем количество попыток для предотвращения бесконечного цикла
         attempts = 0
         
-        while len(self.item_ids) > 0 and attempts < max_attempts:
+        while self.cursor < len(self.item_ids) and attempts < max_attempts:
             attempts += 1
-            item_id = self.item_ids.pop(0)
-            remaining = len(self.item_ids)
-            print(f"📖 Обрабатываем элемент: {item_id} (осталось: {remaining})")
+            item_id = self.item_ids[self.cursor]
+            self.cursor += 1
+            print(f"📖 Обрабатываем элемент: {item_id} (осталось: {self.remaining()})")
             
             try:
-                item_doc = self.book.get_item_with_id(item_id)
+                item_doc = self.book.open(item_id)
                 
                 if item_doc is None:
                     print(f"⚠️ Элемент {item_id} не найден, пропускаем")
                     continue  # Переходим к следующему элементу
                 
-                # Декодируем содержимое
-                try:
-                    content = item_doc.content.decode('utf-8')
-                except UnicodeDecodeError:
-                    print(f"⚠️ Ошибка декодирования UTF-8 для {item_id}, пробуем latin-1")
-                    content = item_doc.content.decode('latin-1')
-                
-                soup = bs(content, "xml")
-                
-                # Пытаемся получить текст из body, если его нет - из всего документа
-                if soup.body:
-                    text = soup.body.get_text()
-                else:
-                    text = soup.get_text()
-                
-                # Очищаем текст от лишних пробелов
-                text = ' '.join(text.split())
+                # Текст по абзацам: строка на абзац или <br>, без <script>/<style> и сносок.
+                # Кодировку lxml берет из XML-декларации документа, глава распаковывается по мере разбора
+                with item_doc:
+                    text = self.extractor.extract(item_doc)
                 
                 if text.strip():
                     print(f"📄 Извлечен текст длиной {len(text)} символов из {item_id}")
@@ -27,17 +27,18 @@ class FileConverter(object):
 
     def save_file_as_chunks(self, user_id, epub_path, sent_mode='by_sense'):
         # Convert epub to chunks and save in YDB
-        book_reader = EpubReader(epub_path)
-        book_title = self._make_filename(user_id, book_reader.get_booktitle())
-        
-        # Получаем ID книги из базы данных
-        db = db_manager.DbManager()
-        book_id = db.get_or_create_book(book_title)
-        
-        # Читаем и сохраняем текст по частям
-        cur_text = book_reader.get_next_item_text()
-        while cur_text is not None:
-            self.chunk_manager.create_chunks(book_id, cur_text, sent_mode)
+        with EpubReader(epub_path) as book_reader:
+            book_title = self._make_filename(user_id, book_reader.get_booktitle())
+
+            # Получаем ID книги из базы данных
+            db = db_manager.DbManager()
+            book_id = db.get_or_create_book(book_title)
+
+            # Читаем и сохраняем текст по частям
             cur_text = book_reader.get_next_item_text()
-            
+            while cur_text is not None:
+                self.chunk_manager.create_chunks(book_id, cur_text, sent_mode)
+                cur_text = book_reader.get_next_item_text()
+            db.update_book_status(book_id, 'ready')
+
         return book_id
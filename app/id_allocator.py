@@ -0,0 +1,87 @@
+import threading
+import config
+from row_mapper import RowMapper
+
+
+class IdAllocator(object):
+    """
+    Allocates row ids without SELECT MAX(id).
+    Ranges (blocks) of ids are leased from counter rows of id_counters table
+    and given out in-process until the block ends (hi/lo scheme).
+    Blocks are shared by all instances in the process.
+    """
+
+    tables = ('users', 'user_books', 'books')
+
+    _blocks = {}  # table -> [next_id, end_id)
+    _lock = threading.Lock()
+
+    lease_query = """
+        DECLARE $name AS Utf8;
+        DECLARE $block AS Uint64;
+
+        SELECT nextId FROM id_counters WHERE name = $name;
+
+        UPDATE id_counters
+        SET nextId = nextId + $block
+        WHERE name = $name;
+    """
+
+    seed_query = """
+        DECLARE $name AS Utf8;
+        DECLARE $next_id AS Uint64;
+
+        INSERT INTO id_counters (name, nextId)
+        VALUES ($name, $next_id);
+    """
+
+    def __init__(self, db_adapter, block_size=None):
+        self.db_adapter = db_adapter
+        self.block_size = block_size or config.id_block_size
+        self.rows = RowMapper()
+
+    def next_id(self, table):
+        if table not in self.tables:
+            raise ValueError(f"Unknown table for id allocation: {table}")
+        with self._lock:
+            block = self._blocks.get(table)
+            if block is None or block[0] >= block[1]:
+                block = self._lease(table)
+                self._blocks[table] = block
+            next_id = block[0]
+            block[0] += 1
+            return next_id
+
+    def _lease(self, table):
+        # one transaction: read counter and move it forward by block size;
+        # missing counter is seeded once, if it is still missing after that - error
+        for attempt in range(2):
+            result = self.db_adapter.execute_query(self.lease_query, {
+                '$name': table,
+                '$block': self.block_size
+            }, name='IdAllocator.lease')
+            start = self.rows.scalar(result, 'nextId')
+            if start is not None:
+                break
+            if attempt == 0:
+                self._seed(table)
+        else:
+            raise RuntimeError(f"Счетчик id для {table} не найден после создания")
+        print(f"🔢 Получен блок id для {table}: {start}..{start + self.block_size - 1}")
+        return [start, start + self.block_size]
+
+    def _seed(self, table):
+        # counter row is missing: start it after existing ids, done once per table
+        max_result = self.db_adapter.execute_query(f"SELECT MAX(id) as max_id FROM {table};",
+                                                  name='IdAllocator.seed_max_id')
+        max_id = self.rows.scalar(max_result, 'max_id')
+        next_id = 1 if max_id is None else int(max_id) + 1
+        try:
+            self.db_adapter.execute_query(self.seed_query, {
+                '$name': table,
+                '$next_id': next_id
+            }, name='IdAllocator.seed')
+            print(f"🔢 Создан счетчик id для {table}, начиная с {next_id}")
+        except Exception as e:
+            # счетчик уже создал другой экземпляр функции
+            print(f"⚠️ Счетчик id для {table} не создан: {e}")
@@ -2,7 +2,6 @@ import json
 import telebot
 import os
 import boto3
-import requests
 import config
 import s3_adapter
 from book_reader import BookReader
@@ -12,11 +11,16 @@ from models.book import Book
 from file_extractor import FileExtractor
 from book_adder import BookAdder
 from shared_functions import send_portion
+from ydb_adapter import YdbAdapter
+from position_buffer import PositionWriteBuffer
+from telegram_client import TelegramClient
 
 # Получаем токен бота из переменных окружения (для тестирования или для продакшена)
 token = os.environ['TOKEN']
 
 bot = telebot.TeleBot(token)
+# запросы telebot идут через общий пул соединений с api.telegram.org
+TelegramClient.shared().install_for_telebot()
 
 s3a = s3_adapter.s3Adapter()
 book_reader = BookReader()
@@ -24,6 +28,15 @@ books_library = BooksLibrary()
 file_extractor = FileExtractor()
 book_adder = BookAdder()
 
+# Соединение с YDB общее для процесса: прогреваем его в фоне при старте контейнера,
+# чтобы первый апдейт Telegram не ждал создания драйвера
+if config.ydb_warm_up:
+    YdbAdapter().warm_up(background=True)
+
+# Позиции чтения пишутся пакетами: по таймеру и в конце каждого вызова
+if config.position_write_behind:
+    PositionWriteBuffer.shared().start_timer()
+
 # Список команд для клавиатуры
 commands = ['/help', '/more', '/my_books', '/auto_status', '/now_reading',
             '/poem_mode', '/change_lang']
@@ -44,14 +57,14 @@ def auto_send_handler(event, context):
     """
     Обработчик для триггера автопересылки
     """
-    from auto_sender import AutoSender
-    from datetime import datetime
+    from auto_sender import AutoSender, trigger_time
 
     print(f"🔄 Получен триггер автопересылки: {event}")
 
     try:
         auto_sender = AutoSender()
-        current_time = datetime.now()
+        # слот берется из времени срабатывания таймера: повтор вызова попадает в тот же слот
+        current_time = trigger_time(event)
         result = auto_sender.process_auto_send(current_time)
 
         print(f"✅ Автопересылка завершена: {result}")
@@ -83,11 +96,15 @@ def handler(event, context):
     """
     Главный обработчик - определяет тип события и направляет в соответствующий handler
     """
-    # Проверяем, это ли триггер автопересылки
-    if 'trigger_type' in event and event['trigger_type'] == 'timer':
-        return auto_send_handler(event, context)
-    else:
-        return telegram_handler(event, context)
+    try:
+        # Проверяем, это ли триггер автопересылки
+        if 'trigger_type' in event and event['trigger_type'] == 'timer':
+            return auto_send_handler(event, context)
+        else:
+            return telegram_handler(event, context)
+    finally:
+        if config.position_write_behind:
+            PositionWriteBuffer.shared().flush()
 
 @bot.message_handler(commands=['start'])
 def start_handler(message):
@@ -0,0 +1,92 @@
+import queue
+import threading
+import config
+from chapter_pool import ChapterPool
+
+
+class IngestPipeline(object):
+    """
+    Book ingestion as a stream: spine items -> text -> sentences -> chunks -> batched writes.
+    Chapters come from ChapterPool as a generator, chunks are grouped into batches
+    of chunks_batch_size and handed to a writer thread through a bounded queue:
+    when YDB is slower than extraction, extraction waits. Memory doesn't depend
+    on book length, and the first chunks can be read while the book is still 'processing'.
+    """
+
+    def __init__(self, chunk_manager, chapter_pool=None, batch_size=None, queue_batches=None):
+        self.chunk_manager = chunk_manager
+        self.chapter_pool = chapter_pool or ChapterPool()
+        self.batch_size = batch_size or config.chunks_batch_size
+        self.queue_batches = queue_batches or config.ingest_queue_batches
+
+    def batches(self, chapters, stats):
+        """
+        Пачки чанков по batch_size из потока глав (index, item_id, chunks)
+
+        Yields:
+            tuple: (чанки пачки, индекс последней главы в пачке)
+        """
+        pending = []
+        item_index = -1
+        for item_index, item_id, chunks in chapters:
+            if not chunks:
+                stats['empty_blocks_skipped'] += 1
+                print(f"⚠️ Пропущен пустой блок {item_id}")
+                continue
+            stats['blocks_processed'] += 1
+            pending.extend(chunks)
+            while len(pending) >= self.batch_size:
+                yield pending[:self.batch_size], item_index
+                pending = pending[self.batch_size:]
+        if pending:
+            yield pending, item_index
+
+    def run(self, book_id, epub_path, item_ids, sent_mode, on_first_write=None, on_progress=None):
+        """
+        Обрабатывает книгу целиком
+
+        Args:
+            on_first_write: Вызывается один раз после записи первой пачки - книгу уже можно читать
+            on_progress: Вызывается после каждой записанной пачки с (глав обработано, всего глав, чанков записано)
+
+        Returns:
+            dict: chunks_created, blocks_processed, empty_blocks_skipped
+        """
+        stats = {'chunks_created': 0, 'blocks_processed': 0, 'empty_blocks_skipped': 0}
+        batches = queue.Queue(maxsize=self.queue_batches)
+        writer = threading.Thread(target=self._write, name='ingest-writer',
+                                  args=(book_id, batches, len(item_ids), stats, on_first_write, on_progress))
+        writer.start()
+        try:
+            chapters = self.chapter_pool.iter_chunks(epub_path, item_ids, sent_mode)
+            for batch in self.batches(chapters, stats):
+                batches.put(batch)  # ждет, если писатель отстает
+        finally:
+            batches.put(None)
+            writer.join()
+        return stats
+
+    def _write(self, book_id, batches, total_items, stats, on_first_write, on_progress):
+        # writer thread: saves batches in order until None
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            chunks, item_index = item
+            try:
+                stats['chunks_created'] += self.chunk_manager.save_chunks(book_id, chunks)
+            except Exception as e:
+                print(f"❌ Ошибка сохранения {len(chunks)} чанков: {e}")
+                # Продолжаем обработку следующих глав
+                continue
+            callbacks = []
+            if on_first_write is not None:
+                callbacks.append((on_first_write, ()))
+                on_first_write = None
+            if on_progress is not None:
+                callbacks.append((on_progress, (item_index + 1, total_items, stats['chunks_created'])))
+            for callback, args in callbacks:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"❌ Ошибка в обработчике записи чанков: {e}")
@@ -3,8 +3,10 @@ import os
 import boto3
 from epub_reader import EpubReader
 from txt_file import BookChunkManager
+from ingest_pipeline import IngestPipeline
 from db_manager import DbManager
 from text_transliter import TextTransliter
+from telegram_client import TelegramClient
 
 
 class MessageQueueProcessor(object):
@@ -48,14 +50,7 @@ class MessageQueueProcessor(object):
     def _send_telegram_notification(self, chat_id, message, token):
         """Отправляем уведомление в Telegram"""
         try:
-            import requests
-            url = f"https://api.telegram.org/bot{token}/sendMessage"
-            data = {
-                'chat_id': chat_id,
-                'text': message,
-                'parse_mode': 'HTML'
-            }
-            response = requests.post(url, data=data)
+            response = TelegramClient.shared().send_message(chat_id, message, token=token)
             if response.status_code == 200:
                 print(f"✅ Уведомление отправлено в Telegram: {message}")
             else:
@@ -107,6 +102,10 @@ class MessageQueueProcessor(object):
                 return
             
             print(f"📨 Обрабатываем сообщение: {message_data}")
+
+            if message_data.get('type') == 'auto_send_shard':
+                self._process_auto_send_shard(message_data)
+                return
             
             # Извлекаем данные
             user_id = message_data.get('user_id')
@@ -195,10 +194,19 @@ class MessageQueueProcessor(object):
                 self._active_processing.remove(processing_key)
                 print(f"⚠️ Обработка прервана с ошибкой, флаг удален: {processing_key}")
 
+    def _process_auto_send_shard(self, message_data):
+        """Шард автопересылки: при ошибке шард продолжит с контрольной точки после повторной постановки в очередь"""
+        from auto_sender import AutoSender
+        try:
+            AutoSender(shards=int(message_data['shards'])).process_shard(message_data)
+        except Exception as e:
+            print(f"❌ Ошибка обработки шарда автопересылки {message_data.get('slot')}/{message_data.get('shard')}: {e}")
+
     def _process_epub_completely(self, user_id, chat_id, epub_path, sending_mode, token):
         """
         Полная обработка EPUB файла без ограничений по времени
         """
+        book_id = None
         try:
             print(f"📖 Начинаем полную обработку EPUB: {epub_path}")
             
@@ -209,8 +217,10 @@ class MessageQueueProcessor(object):
                 token
             )
             
-            book_reader = EpubReader(epub_path)
-            book_title = book_reader.get_booktitle()
+            # нужны только название и список глав, главы читает пул процессов по epub_path
+            with EpubReader(epub_path) as book_reader:
+                book_title = book_reader.get_booktitle()
+                item_ids = book_reader.item_ids
             print(f"📚 Название книги: {book_title}")
             
             if not book_title:
@@ -241,13 +251,8 @@ class MessageQueueProcessor(object):
             
             print(f"✅ Книга создана с ID: {book_id}")
             
-            # Обрабатываем все элементы книги
-            total_chunks_created = 0
-            text_blocks_processed = 0
-            empty_blocks_skipped = 0
-            
             # Получаем общее количество элементов
-            total_items = len(book_reader.item_ids)
+            total_items = len(item_ids)
             print(f"📊 Всего элементов для обработки: {total_items}")
             
             # Отправляем промежуточное уведомление
@@ -257,78 +262,50 @@ class MessageQueueProcessor(object):
                 token
             )
             
-            # ОПТИМИЗАЦИЯ: Собираем все текстовые блоки сначала
-            all_text_blocks = []
-            processing_attempts = 0
-            max_processing_attempts = total_items * 2
-            
-            # Отправляем сообщение о начале обработки блоков
+            # Главы извлекаются и делятся на чанки в пуле процессов (config.book_ingest_workers),
+            # чанки приходят в порядке spine и пишутся пачками по config.chunks_batch_size
+            pipeline = IngestPipeline(self.chunk_manager)
             self._send_telegram_notification(
                 chat_id,
-                f"🔄 Собираю все текстовые блоки...\n⏱️ Это может занять несколько минут",
+                f"🚀 Обрабатываю главы в {pipeline.chapter_pool.workers} процессах...\n⏱️ Это может занять несколько минут",
                 token
             )
             
-            # Сначала собираем все блоки
-            while processing_attempts < max_processing_attempts:
-                processing_attempts += 1
-                text = book_reader.get_next_item_text()
-                if text is None:
-                    break
-                
-                if text.strip():
-                    all_text_blocks.append(text)
-                    print(f"📝 Собран блок {len(all_text_blocks)} длиной {len(text)} символов")
-                else:
-                    empty_blocks_skipped += 1
-                    print(f"⚠️ Пропущен пустой блок #{empty_blocks_skipped}")
-            
-            print(f"📊 Собрано {len(all_text_blocks)} текстовых блоков")
+            from books_library import BooksLibrary
+            books_lib = BooksLibrary()
             
-            # Теперь обрабатываем все блоки батчами
-            batch_size = 5  # Обрабатываем по 5 блоков за раз
-            total_batches = (len(all_text_blocks) + batch_size - 1) // batch_size
+            def on_first_write():
+                # первые чанки записаны - книгу можно читать, пока она в статусе 'processing'
+                books_lib.update_current_book(user_id, chat_id, book_id)
+                books_lib.update_book_pos(user_id, book_id, 0)
+                self._send_telegram_notification(
+                    chat_id,
+                    f"📖 Начало книги уже готово - можно читать командой /more, остальное догрузится",
+                    token
+                )
             
-            self._send_telegram_notification(
-                chat_id,
-                f"🚀 Начинаю батчевую обработку {len(all_text_blocks)} блоков в {total_batches} батчах...",
-                token
-            )
+            progress = {'notified_percent': 0}
             
-            for batch_num in range(0, len(all_text_blocks), batch_size):
-                batch_blocks = all_text_blocks[batch_num:batch_num + batch_size]
-                batch_text = '\n\n'.join(batch_blocks)  # Объединяем блоки
-                
-                print(f"🔄 Обрабатываем батч {batch_num//batch_size + 1}/{total_batches} ({len(batch_blocks)} блоков)")
-                
-                try:
-                    chunks_created = self.chunk_manager.create_chunks(book_id, batch_text, sending_mode)
-                    total_chunks_created += chunks_created
-                    text_blocks_processed += len(batch_blocks)
-                    
-                    # Отправляем прогресс каждые 2 батча
-                    if (batch_num // batch_size + 1) % 2 == 0:
-                        progress_percent = (text_blocks_processed / total_items) * 100
-                        self._send_telegram_notification(
-                            chat_id,
-                            f"📊 Прогресс: {text_blocks_processed}/{total_items} ({progress_percent:.1f}%)\n📚 Создано чанков: {total_chunks_created}",
-                            token
-                        )
-                    
-                    print(f"📊 Обработано блоков: {text_blocks_processed}, создано чанков: {total_chunks_created}")
-                    
-                except Exception as e:
-                    print(f"❌ Ошибка при обработке батча: {e}")
-                    # Продолжаем обработку других батчей
-            
-            if processing_attempts >= max_processing_attempts:
-                print(f"⚠️ Достигнуто максимальное количество попыток обработки ({max_processing_attempts}), прекращаем")
+            def on_progress(items_done, items_total, chunks_created):
+                # Отправляем прогресс примерно каждые 10%
+                progress_percent = (items_done / items_total) * 100 if items_total else 100
+                if progress_percent - progress['notified_percent'] < 10:
+                    return
+                progress['notified_percent'] = progress_percent
                 self._send_telegram_notification(
                     chat_id,
-                    f"⚠️ Обработка прервана из-за превышения лимита попыток\n📊 Обработано блоков: {text_blocks_processed}, создано чанков: {total_chunks_created}",
+                    f"📊 Прогресс: {items_done}/{items_total} ({progress_percent:.1f}%)\n📚 Создано чанков: {chunks_created}",
                     token
                 )
             
+            # книга могла загружаться раньше - до конца загрузки отсутствие чанка не конец книги
+            self.db.update_book_status(book_id, 'processing')
+            stats = pipeline.run(book_id, epub_path, item_ids, sending_mode,
+                                 on_first_write=on_first_write, on_progress=on_progress)
+            total_chunks_created = stats['chunks_created']
+            text_blocks_processed = stats['blocks_processed']
+            empty_blocks_skipped = stats['empty_blocks_skipped']
+            
             print(f"✅ Обработка завершена. Обработано блоков: {text_blocks_processed}, создано чанков: {total_chunks_created}, пропущено пустых: {empty_blocks_skipped}")
             
             # Отправляем сообщение о завершении обработки блоков
@@ -338,11 +315,13 @@ class MessageQueueProcessor(object):
                 token
             )
             
-            # Обновляем библиотеку пользователя
-            from books_library import BooksLibrary
-            books_lib = BooksLibrary()
-            books_lib.update_current_book(user_id, chat_id, book_id)
-            books_lib.update_book_pos(user_id, book_id, 0)
+            # Все чанки записаны - дальше отсутствие чанка означает конец книги
+            self.db.update_book_status(book_id, 'ready')
+            
+            if total_chunks_created == 0:
+                # в книге нет текста - в библиотеку добавляем, как и раньше
+                books_lib.update_current_book(user_id, chat_id, book_id)
+                books_lib.update_book_pos(user_id, book_id, 0)
             
             # Отправляем сообщение о завершении сохранения
             self._send_telegram_notification(
@@ -362,5 +341,8 @@ class MessageQueueProcessor(object):
             print(f"❌ Error processing EPUB completely: {str(e)}")
             import traceback
             print(f"❌ Traceback: {traceback.format_exc()}")
+            if book_id is not None:
+                # книга не останется в 'processing': записанные чанки читаются, дальше - конец книги
+                self.db.update_book_status(book_id, 'failed')
             return {'success': False, 'error': str(e)}
 
@@ -0,0 +1,136 @@
+import re
+import config
+
+
+class MessageSplitter(object):
+    """
+    Splits long text into messages not longer than max_size.
+    Cuts at paragraph, then sentence, then word boundary, never inside
+    an HTML tag or entity. HTML tags open at the cut are closed at the end
+    of the piece and opened again at the start of the next one; both are
+    counted in the piece length. Tags are not reopened if they would take
+    more than half of the message.
+    """
+
+    _tag_re = re.compile(r'<(/?)([a-zA-Z][\w-]*)[^>]*>')
+    _sentence_end_re = re.compile(r'[.!?…]+["»”)\]]*\s+')
+    _space_re = re.compile(r'\s+')
+    _void_tags = ('br',)
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or config.max_msg_size
+
+    def split(self, text, max_size=None):
+        max_size = max_size or self.max_size
+        if text is None:
+            return []
+        if len(text) <= max_size:
+            return [text] if text else []
+
+        pieces = []
+        prefix = ''       # tags reopened from previous piece
+        open_tags = []    # [(name, opening tag)] still open at the end of current piece
+        rest = text
+        while rest:
+            closing_reserve = self._closing_reserve(open_tags, rest)
+            limit = max_size - len(prefix) - closing_reserve
+            if limit < max_size // 2:
+                # переоткрытые теги и их закрытие заняли бы больше половины сообщения - режем как обычный текст
+                prefix, open_tags, limit = '', [], max_size
+            if len(rest) <= limit:
+                pieces.append(prefix + rest)
+                break
+            fitted = self._fit(rest, prefix, open_tags, limit, max_size)
+            if fitted is None:
+                # открытые теги и их закрытие не помещаются вместе с текстом - не переоткрываем их
+                prefix, open_tags = '', []
+                fitted = self._fit(rest, prefix, open_tags, max_size, max_size)
+            if fitted is None:
+                # один тег длиннее сообщения - режем как есть
+                fitted = max_size, rest[:max_size], [], ''
+            cut, body, open_tags, closing = fitted
+            rest = rest[cut:].lstrip()
+            if body:
+                pieces.append(prefix + body + closing)
+            prefix = ''.join(tag for _, tag in open_tags)
+        return pieces
+
+    def _fit(self, rest, prefix, open_tags, limit, max_size):
+        # cut not after limit, moved back until prefix + body + closing tags fit into max_size.
+        # None if even the shortest body doesn't fit with prefix
+        while limit > 0:
+            cut = self._cut_position(rest, limit)
+            body = rest[:cut].rstrip()
+            tags = self._open_tags(body, open_tags)
+            closing = ''.join(f'</{name}>' for name, _ in reversed(tags))
+            overflow = len(prefix) + len(body) + len(closing) - max_size
+            if overflow <= 0:
+                return cut, body, tags, closing
+            limit = min(limit - overflow, cut - 1)
+        return None
+
+    def _closing_reserve(self, open_tags, rest):
+        # room for closing tags of already open ones; tags opened in the piece are checked by _fit
+        return sum(len(name) + 3 for name, _ in open_tags)
+
+    def _cut_position(self, text, limit):
+        # best boundary not after limit: paragraph > sentence > word > any safe position
+        window = text[:limit + 1]
+        half = limit // 2
+
+        paragraph = window.rfind('\n', 0, limit + 1)
+        if paragraph > half:
+            return self._safe(text, paragraph + 1)
+
+        sentence = None
+        for match in self._sentence_end_re.finditer(window):
+            if match.end() <= limit:
+                sentence = match.end()
+        if sentence is not None and sentence > half:
+            return self._safe(text, sentence)
+
+        space = None
+        for match in self._space_re.finditer(window):
+            # spaces between tag attributes are not word boundaries
+            if match.start() <= limit and self._markup_start(text, match.start()) is None:
+                space = match.start()
+        if space:
+            return self._safe(text, space)
+
+        return self._safe(text, limit)
+
+    def _markup_start(self, text, pos):
+        # start of <tag> or &entity; that pos is inside of, None if pos is outside of them
+        tag_start = text.rfind('<', 0, pos)
+        if tag_start != -1 and text.rfind('>', 0, pos) < tag_start:
+            return tag_start
+        amp = text.rfind('&', 0, pos)
+        if amp != -1 and pos - amp <= 10 and ';' not in text[amp:pos] and re.match(r'&#?\w+;', text[amp:]):
+            return amp
+        return None
+
+    def _safe(self, text, pos):
+        # move cut back if it is inside <tag> or &entity;, forward past it if the text starts with it
+        start = self._markup_start(text, pos)
+        if start is None:
+            return pos
+        if start > 0:
+            return start
+        end = text.find('>' if text[0] == '<' else ';') + 1
+        return end if end > 0 else pos
+
+    def _open_tags(self, body, open_tags):
+        # tags open after body, given tags open before it
+        stack = list(open_tags)
+        for match in self._tag_re.finditer(body):
+            closing, name = match.group(1), match.group(2).lower()
+            if name in self._void_tags or match.group(0).endswith('/>'):
+                continue
+            if closing:
+                for i in range(len(stack) - 1, -1, -1):
+                    if stack[i][0] == name:
+                        del stack[i]
+                        break
+            else:
+                stack.append((name, match.group(0)))
+        return stack
@@ -0,0 +1,208 @@
+import re
+import threading
+import config
+from collections import namedtuple
+
+
+# one executed query
+QuerySample = namedtuple('QuerySample', [
+    'name',          # normalized query name (DbManager method or statement + table)
+    'duration',      # seconds, whole execute_query including retries
+    'session_wait',  # seconds until the first attempt got a session
+    'retries',       # attempts after the first one
+    'rows',          # rows in all result sets
+    'ru',            # request units, None if server did not report them
+    'error',         # exception class name or None
+])
+
+
+class LogSink(object):
+    """one log line per query"""
+
+    def __init__(self, slow_threshold=0.0):
+        # queries faster than threshold (seconds) are not logged
+        self.slow_threshold = slow_threshold
+
+    def record(self, sample):
+        if sample.error is None and sample.duration < self.slow_threshold:
+            return
+        ru = '-' if sample.ru is None else sample.ru
+        status = 'ok' if sample.error is None else sample.error
+        print(f"⏱️ query={sample.name} time={sample.duration * 1000:.1f}ms "
+              f"session_wait={sample.session_wait * 1000:.1f}ms retries={sample.retries} "
+              f"rows={sample.rows} ru={ru} status={status}")
+
+
+class HistogramSink(object):
+    """
+    In-memory latency histograms by query name.
+    Buckets are upper bounds in seconds, like Prometheus histograms.
+    """
+
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.default_buckets)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _new_stats(self):
+        return {
+            'count': 0,
+            'errors': 0,
+            'retries': 0,
+            'rows': 0,
+            'ru': 0.0,
+            'sum': 0.0,
+            'session_wait_sum': 0.0,
+            'max': 0.0,
+            'buckets': [0] * (len(self.buckets) + 1),  # last one is +Inf
+        }
+
+    def record(self, sample):
+        with self._lock:
+            stats = self._stats.get(sample.name)
+            if stats is None:
+                stats = self._stats[sample.name] = self._new_stats()
+            stats['count'] += 1
+            stats['errors'] += sample.error is not None
+            stats['retries'] += sample.retries
+            stats['rows'] += sample.rows
+            stats['ru'] += sample.ru or 0.0
+            stats['sum'] += sample.duration
+            stats['session_wait_sum'] += sample.session_wait
+            stats['max'] = max(stats['max'], sample.duration)
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if sample.duration <= bound:
+                    index = i
+                    break
+            stats['buckets'][index] += 1
+
+    def snapshot(self):
+        # {name: stats} copy, safe to read while queries are recorded
+        with self._lock:
+            return {name: dict(stats, buckets=list(stats['buckets']))
+                    for name, stats in self._stats.items()}
+
+    def percentile(self, name, q):
+        """
+        Upper bound of the bucket with q-th percentile (q in 0..1),
+        max observed value for the +Inf bucket, None if there are no samples
+        """
+        stats = self.snapshot().get(name)
+        if not stats or stats['count'] == 0:
+            return None
+        rank = q * stats['count']
+        seen = 0
+        for i, count in enumerate(stats['buckets']):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else stats['max']
+        return stats['max']
+
+    def top(self, q=0.99, limit=10):
+        # [(name, percentile)] slowest first
+        names = self.snapshot().keys()
+        values = [(name, self.percentile(name, q)) for name in names]
+        return sorted(values, key=lambda item: item[1], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+class PrometheusSink(HistogramSink):
+    """histograms rendered in Prometheus text exposition format"""
+
+    prefix = 'partybook_ydb_query'
+
+    def __init__(self, buckets=None, prefix=None):
+        super().__init__(buckets)
+        if prefix:
+            self.prefix = prefix
+
+    def dump(self):
+        lines = [
+            f"# TYPE {self.prefix}_duration_seconds histogram",
+        ]
+        snapshot = self.snapshot()
+        for name, stats in sorted(snapshot.items()):
+            label = f'query="{name}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, stats['buckets']):
+                cumulative += count
+                lines.append(f'{self.prefix}_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.prefix}_duration_seconds_bucket{{{label},le="+Inf"}} {stats["count"]}')
+            lines.append(f'{self.prefix}_duration_seconds_sum{{{label}}} {stats["sum"]}')
+            lines.append(f'{self.prefix}_duration_seconds_count{{{label}}} {stats["count"]}')
+        for metric, key in (('errors_total', 'errors'), ('retries_total', 'retries'),
+                            ('rows_total', 'rows'), ('request_units_total', 'ru'),
+                            ('session_wait_seconds_total', 'session_wait_sum')):
+            lines.append(f"# TYPE {self.prefix}_{metric} counter")
+            for name, stats in sorted(snapshot.items()):
+                lines.append(f'{self.prefix}_{metric}{{query="{name}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+class QueryMetrics(object):
+    """
+    Collects QuerySample of every YDB query and passes them to sinks.
+    A sink is any object with record(sample).
+    """
+
+    _declare_re = re.compile(r'^\s*(DECLARE|PRAGMA)\b[^;]*;', re.IGNORECASE | re.MULTILINE)
+    _statement_re = re.compile(
+        r'\b(SELECT|UPSERT\s+INTO|INSERT\s+INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\b', re.IGNORECASE)
+    _table_re = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+`?([\w/]+)`?', re.IGNORECASE)
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        with self._lock:
+            if sink in self.sinks:
+                self.sinks.remove(sink)
+
+    def normalize(self, query):
+        # name for query without explicit name: first statement and table, e.g. "select users"
+        text = self._declare_re.sub('', query)
+        statement = self._statement_re.search(text)
+        if statement is None:
+            return 'query'
+        table = self._table_re.search(text, statement.start())
+        verb = statement.group(1).split()[0].lower()
+        return f"{verb} {table.group(1)}" if table else verb
+
+    def record(self, sample):
+        with self._lock:
+            sinks = list(self.sinks)
+        for sink in sinks:
+            try:
+                sink.record(sample)
+            except Exception as e:
+                # метрики не должны ломать запрос
+                print(f"⚠️ Ошибка записи метрики {sample.name}: {e}")
+
+
+def rows_count(result):
+    # rows in all result sets of execute result
+    if not result:
+        return 0
+    try:
+        return sum(len(result_set.rows) for result_set in result)
+    except TypeError:
+        return 0
+
+
+# метрики запросов процесса, общие для всех YdbAdapter
+query_metrics = QueryMetrics()
+query_histogram = query_metrics.add_sink(PrometheusSink())
+if config.slow_query_log_ms >= 0:
+    query_metrics.add_sink(LogSink(config.slow_query_log_ms / 1000))
@@ -0,0 +1,125 @@
+import atexit
+import threading
+import config
+from ydb_adapter import YdbAdapter
+
+
+class PositionWriteBuffer(object):
+    """
+    Write-behind of reading positions (config.position_write_behind).
+    New positions are kept in memory by (user_id, book_id) and written
+    by one UPSERT for many users: at the end of invocation and by timer.
+    Until then DbManager reads them from here (read-your-writes).
+    Flush at exit is best effort only: it does not run if the instance is frozen or killed.
+    """
+
+    flush_query = """
+        DECLARE $positions AS List<Struct<userId: Uint64, bookId: Uint64, pos: Uint64>>;
+
+        UPSERT INTO user_books (id, pos)
+        SELECT ub.id AS id, p.pos AS pos
+        FROM AS_TABLE($positions) AS p
+        JOIN user_books VIEW idx_user_id AS ub
+        ON ub.userId = p.userId AND ub.bookId = p.bookId;
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_adapter=None, batch_size=None):
+        self.db_adapter = db_adapter or YdbAdapter()
+        self.batch_size = batch_size or config.position_flush_batch_size
+        self._pending = {}  # (user_id, book_id) -> pos
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self.flushed = 0
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+                    atexit.register(cls._shared.flush)
+        return cls._shared
+
+    def put(self, user_id, book_id, pos):
+        with self._lock:
+            self._pending[(user_id, book_id)] = pos
+
+    def pending(self, user_id, book_id):
+        # position not written yet or None
+        with self._lock:
+            return self._pending.get((user_id, book_id))
+
+    def discard(self, user_id, book_id):
+        # position was written directly, buffered one is outdated
+        with self._lock:
+            self._pending.pop((user_id, book_id), None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Пишет накопленные позиции, по batch_size строк на запрос
+
+        Returns:
+            int: Количество записанных позиций
+        """
+        with self._flush_lock:
+            # позиции остаются в буфере, пока не записаны
+            with self._lock:
+                entries = list(self._pending.items())
+            if not entries:
+                return 0
+
+            written = 0
+            for start in range(0, len(entries), self.batch_size):
+                batch = entries[start:start + self.batch_size]
+                try:
+                    self.db_adapter.execute_query(self.flush_query, {
+                        '$positions': [
+                            {'userId': user_id, 'bookId': book_id, 'pos': pos}
+                            for (user_id, book_id), pos in batch
+                        ]
+                    }, name='PositionWriteBuffer.flush')
+                except Exception as e:
+                    print(f"❌ Ошибка записи {len(batch)} позиций чтения: {e}")
+                    break
+                self._forget(batch)
+                written += len(batch)
+
+            self.flushed += written
+            print(f"💾 Записано {written} позиций чтения одним пакетом")
+            return written
+
+    def _forget(self, entries):
+        # убрать записанные позиции, если за время записи не появились более новые
+        with self._lock:
+            for key, pos in entries:
+                if self._pending.get(key) == pos:
+                    del self._pending[key]
+
+    def start_timer(self, interval_ms=None):
+        # flush every interval_ms in background thread
+        interval = (interval_ms or config.position_flush_interval_ms) / 1000
+        if self._timer is not None:
+            return self._timer
+
+        def run():
+            while not stop.wait(interval):
+                self.flush()
+
+        stop = threading.Event()
+        self._timer = threading.Thread(target=run, name='position-flush', daemon=True)
+        self._timer.stop = stop
+        self._timer.start()
+        return self._timer
+
+    def stop_timer(self):
+        if self._timer is not None:
+            self._timer.stop.set()
+            self._timer = None
@@ -137,6 +137,50 @@ class QueueSender(object):
             print(f"❌ Неожиданная ошибка при отправке батча: {e}")
             return False
 
+    def send_auto_send_shard_message(self, shard_data):
+        """
+        Отправляем в очередь шард запуска автопересылки
+
+        Args:
+            shard_data: slot, time, shard, shards
+
+        Returns:
+            bool: True если сообщение отправлено успешно
+        """
+        try:
+            if not self.queue_url:
+                print(f"❌ MESSAGE_QUEUE_URL не настроен")
+                return False
+
+            message_data = dict(shard_data, type='auto_send_shard', timestamp=str(int(time.time())))
+            message_body = json.dumps(message_data)
+
+            response = self.sqs_client.send_message(
+                QueueUrl=self.queue_url,
+                MessageBody=message_body,
+                MessageAttributes={
+                    'MessageType': {
+                        'StringValue': 'auto_send_shard',
+                        'DataType': 'String'
+                    },
+                    'Slot': {
+                        'StringValue': shard_data.get('slot', 'unknown'),
+                        'DataType': 'String'
+                    }
+                }
+            )
+
+            print(f"✅ Шард {shard_data.get('shard')}/{shard_data.get('shards')} слота {shard_data.get('slot')} "
+                  f"отправлен: {response['MessageId']}")
+            return True
+
+        except ClientError as e:
+            print(f"❌ Ошибка отправки шарда в очередь: {e}")
+            return False
+        except Exception as e:
+            print(f"❌ Неожиданная ошибка при отправке шарда: {e}")
+            return False
+
     def send_test_message(self):
         """Отправляем тестовое сообщение для проверки подключения"""
         try:
@@ -0,0 +1,93 @@
+from models.book import Book
+
+
+class RowMapper(object):
+    """
+    Reading typed values from YDB result sets.
+    Rows of ydb SDK are dicts keyed by column name, so values are taken as is,
+    without converting the row to text and parsing it back.
+    """
+
+    def rows(self, result, index=0):
+        # rows of result set with given index, empty list if there is no result
+        if not result or len(result) <= index:
+            return []
+        return result[index].rows
+
+    def first(self, result, index=0):
+        # first row of result set or None
+        rows = self.rows(result, index)
+        if len(rows) == 0:
+            return None
+        return rows[0]
+
+    def value(self, row, column, default=None):
+        # column value of the row. String columns come as bytes, decode them
+        if row is None:
+            return default
+        value = row.get(column)
+        if value is None:
+            return default
+        if isinstance(value, bytes):
+            return value.decode('utf-8', errors='ignore')
+        return value
+
+    def scalar(self, result, column, default=None):
+        # value of column from the first row
+        return self.value(self.first(result), column, default)
+
+    def to_dict(self, row, columns):
+        # {column: value} for listed columns
+        return {column: self.value(row, column) for column in columns}
+
+    def to_book(self, row, id_column='bookId', name_column='bookName',
+                pos_column='pos', mode_column='mode'):
+        if row is None:
+            return None
+        return Book(
+            id=self.value(row, id_column),
+            name=self.value(row, name_column),
+            pos=self.value(row, pos_column, 0),
+            mode=self.value(row, mode_column),
+        )
+
+    def to_portion(self, row):
+        # row of DbManager.read_next_chunk_query -> dict, None if user has no current book
+        if row is None:
+            return None
+        text = self.value(row, 'text')
+        pos = self.value(row, 'pos', 0)
+        chunk_count = self.value(row, 'chunkCount')
+        if text is None:
+            # пока книга обрабатывается, чанков может быть еще не видно - это не конец
+            end_of_book = self.value(row, 'status') != 'processing'
+            if chunk_count is not None:
+                end_of_book = end_of_book and pos >= chunk_count
+        else:
+            end_of_book = False
+        return {
+            'book_id': self.value(row, 'bookId'),
+            'mode': self.value(row, 'mode'),
+            'text': text,
+            'lang': self.value(row, 'lang'),
+            'pos': pos + 1 if text is not None else pos,
+            'chunk_count': chunk_count,
+            'end_of_book': end_of_book,
+        }
+
+    def to_auto_send_user(self, row):
+        return {
+            'user_id': self.value(row, 'userId'),
+            'chat_id': self.value(row, 'chatId'),
+            'lang': self.value(row, 'lang', 'ru'),
+            'time': self.value(row, 'time')
+        }
+
+    def to_due_delivery(self, row):
+        # row of DbManager.claim_due_deliveries_query: user and portion, portion is None without active book
+        delivery = self.to_auto_send_user(row)
+        if self.value(row, 'bookId') is None:
+            delivery['portion'] = None
+        else:
+            delivery['portion'] = self.to_portion(row)
+        return delivery
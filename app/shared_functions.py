@@ -6,6 +6,7 @@
 import config
 from books_library import BooksLibrary
 from book_reader import BookReader
+from message_splitter import MessageSplitter
 
 
 def book_finished(portion):
@@ -32,10 +33,12 @@ def turn_off_autostatus(user_id, chat_id, bot):
         bot.send_message(chat_id, auto_off_msg, reply_markup=user_markup)
 
 
-def send_portion(user_id, chat_id, bot=None):
+def send_portion(user_id, chat_id, bot=None, portion=None, prefetched=False):
     """
     Отправляет следующий чанк пользователю
     Если bot=None, то отправляет через requests (для автопересылки)
+    portion - уже прочитанная порция (из delivery_ledger), иначе читается здесь
+    prefetched - portion прочитана заранее, даже если она None (нет активной книги)
     """
     books_lib = BooksLibrary()
     book_reader = BookReader()
@@ -44,11 +47,17 @@ def send_portion(user_id, chat_id, bot=None):
         if bot:
             bot.send_chat_action(chat_id, 'typing')
         
-        lang = books_lib.get_lang(user_id)
+        # Чанк, позиция и язык пользователя приходят одним запросом
+        if portion is None and not prefetched:
+            portion = book_reader.read_next(user_id)
+        if portion is not None and portion['lang']:
+            lang = portion['lang']
+        else:
+            lang = books_lib.get_lang(user_id)
         if lang not in config.error_user_finding:
             lang = 'ru'  # Fallback на русский язык
         
-        msg = book_reader.get_next_portion(user_id)
+        msg = book_reader.portion_text(portion)
         
         if msg is None:
             msg = config.error_user_finding[lang]
@@ -76,9 +85,8 @@ def send_portion(user_id, chat_id, bot=None):
         # Отправляем сообщение
         if bot:
             # Обычная отправка через bot
-            max_telegram_size = 4096
-            for i in range(0, len(msg), max_telegram_size):
-                bot.send_message(chat_id, msg[i:i+max_telegram_size])
+            for piece in MessageSplitter().split(msg):
+                bot.send_message(chat_id, piece)
         else:
             # Для автопересылки возвращаем данные для отправки через requests
             return {'success': True, 'message': msg}
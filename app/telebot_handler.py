@@ -7,6 +7,7 @@ import telebot
 import config
 from book_adder import BookAdder
 from book_reader import BookReader
+from message_splitter import MessageSplitter
 from books_library import BooksLibrary
 from file_extractor import FileExtractor
 
@@ -326,11 +327,8 @@ def send_portion(user_id, chat_id):
             
         # Отправляем сообщение
         # При этом разбиваем сообщение на части, если оно слишком большое
-        max_telegram_size = 4096
-        while len(msg) > 0:
-            chunk = msg[:max_telegram_size]
+        for chunk in MessageSplitter().split(msg):
             bot.send_message(chat_id, chunk, reply_markup=markup([]))
-            msg = msg[max_telegram_size:]
             
         return 0
     except Exception as e:
@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from metrics import QueryMetrics, QuerySample, PrometheusSink, LogSink
+
+
+# время запросов к Bot API по методам (sendMessage, sendDocument, ...)
+telegram_metrics = QueryMetrics()
+telegram_histogram = telegram_metrics.add_sink(PrometheusSink(prefix='partybook_telegram_request'))
+if config.slow_query_log_ms >= 0:
+    telegram_metrics.add_sink(LogSink(config.slow_query_log_ms / 1000))
+
+
+class TelegramClient(object):
+    """
+    Bot API over one requests.Session with keep-alive connection pool,
+    so messages reuse TLS connections to api.telegram.org.
+    Shared by the process; telebot is switched to it by install_for_telebot().
+    """
+
+    api_url = 'https://api.telegram.org/bot{token}/{method}'
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, token=None, pool_size=None, connect_timeout=None, read_timeout=None):
+        self.token = token or os.environ.get('TOKEN')
+        self.pool_size = pool_size or config.telegram_pool_size
+        self.timeout = (connect_timeout or config.telegram_connect_timeout,
+                        read_timeout or config.telegram_read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0, pool_block=True)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def _method_name(self, url):
+        # last part of Bot API url: .../bot<token>/sendMessage -> sendMessage
+        return url.rstrip('/').rsplit('/', 1)[-1].split('?', 1)[0]
+
+    def request(self, method, url, **kwargs):
+        # every HTTP call to Telegram, also used as telebot CUSTOM_REQUEST_SENDER
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.monotonic()
+        error = None
+        response = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            if response.status_code >= 400:
+                error = f"HTTP{response.status_code}"
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            telegram_metrics.record(QuerySample(
+                name=self._method_name(url),
+                duration=time.monotonic() - started,
+                session_wait=0.0,
+                retries=0,
+                rows=0,
+                ru=None,
+                error=error,
+            ))
+
+    def call(self, api_method, payload, token=None):
+        # POST to Bot API method with json payload, returns requests.Response
+        url = self.api_url.format(token=token or self.token, method=api_method)
+        return self.request('post', url, json=payload)
+
+    def send_message(self, chat_id, text, parse_mode='HTML', token=None):
+        return self.call('sendMessage', {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': parse_mode
+        }, token=token)
+
+    def install_for_telebot(self):
+        # telebot sends all its requests through this client
+        from telebot import apihelper
+        apihelper.CUSTOM_REQUEST_SENDER = self.request
+        return self
+
+    def close(self):
+        self.session.close()
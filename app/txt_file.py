@@ -4,33 +4,87 @@ from time import gmtime, strftime
 from text_separator import TextSeparator
 import config
 from db_manager import DbManager
+from chunk_cache import ChunkCache
+from message_splitter import MessageSplitter
 
 class BookChunkManager(object):
     """
     Class for managing book text chunks in YDB
     """
 
+    sentences_per_chunk = 5
+
     def __init__(self):
         self.db = DbManager()
         self.chunk_size = config.piece_size
+        self.cache = ChunkCache.shared()
+        self.prefetch_size = config.chunk_prefetch_size
+        # место под подписи к чанку (/more, конец книги) в том же сообщении
+        self.splitter = MessageSplitter(config.max_msg_size - config.chunk_msg_reserve)
 
-    def create_chunks(self, book_id, text, sent_mode):
+    @classmethod
+    def build_chunks(cls, text, sent_mode, splitter=None):
+        """
+        Чанки текста без обращения к базе - можно вызывать в отдельном процессе
+
+        Returns:
+            list: Тексты чанков по порядку
+        """
+        return list(cls.iter_chunks([text], sent_mode, splitter))
+
+    @classmethod
+    def iter_chunks(cls, lines, sent_mode, splitter=None, block_size=None):
+        """
+        Чанки потока строк текста. Строки копятся блоком до block_size символов,
+        блок делится на предложения, предложения - на чанки по sentences_per_chunk.
+        Неполный чанк в конце блока переходит в следующий блок
+
+        Args:
+            lines: Итератор строк текста (например, XhtmlTextExtractor.iter_lines)
+            sent_mode: Режим разбивки на предложения
+            block_size: Символов в блоке (по умолчанию config.ingest_text_block_size)
+        """
+        splitter = splitter or MessageSplitter(config.max_msg_size - config.chunk_msg_reserve)
+        block_size = block_size or config.ingest_text_block_size
+        sentences = []
+        block = []
+        size = 0
+        for line in lines:
+            block.append(line)
+            size += len(line) + 1
+            if size >= block_size:
+                sentences.extend(cls._sentences(block, sent_mode))
+                block, size = [], 0
+                sentences = yield from cls._group(sentences, splitter, final=False)
+        if block:
+            sentences.extend(cls._sentences(block, sent_mode))
+        yield from cls._group(sentences, splitter, final=True)
+
+    @staticmethod
+    def _sentences(block, sent_mode):
         # Разбиваем текст на предложения
-        sentences = TextSeparator(text, mode=sent_mode).get_sentences()
+        sentences = TextSeparator('\n'.join(block), mode=sent_mode).get_sentences()
         print(f"📝 Получено {len(sentences)} предложений")
-        
-        # Группируем предложения в чанки по 5 предложений
-        sentences_per_chunk = 5
-        chunks_to_save = []
-        
-        for i in range(0, len(sentences), sentences_per_chunk):
+        return sentences
+
+    @classmethod
+    def _group(cls, sentences, splitter, final):
+        # Группируем предложения в чанки по 5 предложений, возвращает предложения, не попавшие в чанк
+        step = cls.sentences_per_chunk
+        full = len(sentences) if final else len(sentences) - len(sentences) % step
+        for i in range(0, full, step):
             # Берем следующие 5 предложений (или меньше, если это конец)
-            chunk_sentences = sentences[i:i + sentences_per_chunk]
-            current_chunk = ' '.join(chunk_sentences)
+            current_chunk = ' '.join(sentences[i:i + step])
             
             if current_chunk.strip():
-                chunks_to_save.append(current_chunk)
-        
+                # длинный чанк сразу делим на сообщения, чтобы не делить его при каждой отправке
+                yield from splitter.split(current_chunk)
+        return sentences[full:]
+
+    def create_chunks(self, book_id, text, sent_mode):
+        return self.save_chunks(book_id, self.build_chunks(text, sent_mode, self.splitter))
+
+    def save_chunks(self, book_id, chunks_to_save):
         # БАТЧИНГ: Сохраняем все чанки одним запросом
         if chunks_to_save:
             try:
@@ -62,12 +116,22 @@ class BookChunkManager(object):
         return chunks_created
 
     def read_piece(self, book_id, pos):
-        # Получаем чанк из базы данных
-        chunk = self.db.get_chunk(book_id, pos)
+        # Чанк из кэша, при промахе - из базы вместе со следующими (чтение идет подряд)
+        chunk = self.cache.get(book_id, pos)
+        if chunk is None:
+            chunk = self._prefetch(book_id, pos)
         if chunk is None:
             return None, pos
         
         return chunk, pos + 1
 
+    def _prefetch(self, book_id, pos):
+        # одним запросом читаем окно pos..pos+prefetch_size-1 и кладем его в кэш
+        chunks = self.db.get_chunks_range(book_id, pos, pos + self.prefetch_size - 1)
+        self.cache.put_many(book_id, chunks)
+        if chunks:
+            print(f"📚 Прочитано вперед {len(chunks)} чанков книги {book_id} с позиции {pos}")
+        return chunks.get(pos)
+
     def get_total_chunks(self, book_id):
         return self.db.get_total_chunks(book_id)
@@ -0,0 +1,101 @@
+import time
+import threading
+from collections import OrderedDict
+import config
+
+
+class UserStateCache(object):
+    """
+    State of users shared by the process: lang, auto_send, time and
+    current_book (book_id, book_name, pos, mode).
+    Every value lives ttl seconds, so changes made by other containers are seen
+    after ttl at most. DbManager writes changes through and drops what it can't update.
+    """
+
+    fields = ('lang', 'auto_send', 'time', 'current_book')
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ttl=None, max_users=None):
+        self.ttl = config.user_state_ttl if ttl is None else ttl
+        self.max_users = max_users or config.user_state_cache_size
+        self._users = OrderedDict()  # user_id -> {field: (value, expires_at)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def get(self, user_id, field, default=None):
+        with self._lock:
+            state = self._users.get(user_id)
+            item = state.get(field) if state else None
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del state[field]
+                self.misses += 1
+                return default
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return item[0]
+
+    def set(self, user_id, **values):
+        # None values are not cached: "unknown" and "not set in DB" look the same
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._users[user_id] = {}
+            for field, value in values.items():
+                if field not in self.fields:
+                    raise ValueError(f"Unknown user state field: {field}")
+                if value is None:
+                    state.pop(field, None)
+                else:
+                    state[field] = (value, expires_at)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def update_pos(self, user_id, book_id, pos):
+        # new pos for cached current book, if the book is the same
+        with self._lock:
+            state = self._users.get(user_id)
+            item = state.get('current_book') if state else None
+            if item is None:
+                return
+            current_id, name, _, mode = item[0]
+            if current_id == book_id:
+                state['current_book'] = ((current_id, name, pos, mode), item[1])
+            else:
+                del state['current_book']
+
+    def invalidate(self, user_id, *fields):
+        # drop listed fields of user or whole user if fields are not given
+        with self._lock:
+            if not fields:
+                self._users.pop(user_id, None)
+                return
+            state = self._users.get(user_id)
+            if state:
+                for field in fields:
+                    state.pop(field, None)
+
+    def clear(self):
+        with self._lock:
+            self._users = OrderedDict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,121 @@
+from lxml import etree
+
+
+class XhtmlTextExtractor(object):
+    """
+    Streaming text of XHTML document (chapter of EPUB) by lxml target parser:
+    no tree is built, paragraphs are yielded while the document is parsed.
+    Block elements and <br> end a line, whitespace inside a line is collapsed.
+    <head>, <script>, <style> and footnotes (epub:type, role or class) are skipped.
+    """
+
+    block_tags = frozenset((
+        'address', 'article', 'aside', 'blockquote', 'body', 'caption', 'dd', 'div', 'dl', 'dt',
+        'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr',
+        'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul',
+    ))
+    skip_tags = frozenset(('head', 'script', 'style', 'noscript', 'template'))
+    note_types = frozenset((
+        'footnote', 'footnotes', 'endnote', 'endnotes', 'rearnote', 'rearnotes', 'noteref',
+        'doc-footnote', 'doc-endnote', 'doc-endnotes', 'doc-noteref',
+    ))
+    # back link from note to text in books converted from fb2
+    note_classes = note_types | frozenset(('note_anchor',))
+
+    def __init__(self, feed_size=64 * 1024):
+        self.feed_size = feed_size
+
+    def iter_lines(self, source):
+        """
+        Строки текста документа по мере разбора
+
+        Args:
+            source: Содержимое документа (bytes) или файловый объект с read()
+        """
+        target = _TextTarget(self)
+        parser = etree.XMLParser(target=target, recover=True, resolve_entities=False,
+                                 no_network=True, huge_tree=True)
+        for piece in self._pieces(source):
+            parser.feed(piece)
+            yield from target.drain()
+        parser.close()
+        yield from target.drain()
+
+    def extract(self, source):
+        # whole text, lines joined by newline
+        return '\n'.join(self.iter_lines(source))
+
+    def _pieces(self, source):
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        if isinstance(source, (bytes, bytearray)):
+            for start in range(0, len(source), self.feed_size):
+                yield bytes(source[start:start + self.feed_size])
+            return
+        while True:
+            piece = source.read(self.feed_size)
+            if not piece:
+                return
+            yield piece
+
+    def _is_note(self, attrib):
+        for name, value in attrib.items():
+            if name.endswith('}type') or name in ('epub:type', 'role'):
+                if self.note_types.intersection(value.lower().split()):
+                    return True
+            elif name == 'class':
+                if self.note_classes.intersection(value.lower().split()):
+                    return True
+        return False
+
+
+class _TextTarget(object):
+    # parser target: collects text of current line, finished lines wait in self.lines
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.lines = []
+        self.parts = []
+        self.skip_depth = 0
+
+    def _local(self, tag):
+        return tag.rsplit('}', 1)[-1].lower() if isinstance(tag, str) else ''
+
+    def start(self, tag, attrib):
+        if self.skip_depth:
+            self.skip_depth += 1
+            return
+        local = self._local(tag)
+        if local in self.extractor.skip_tags or self.extractor._is_note(attrib):
+            self.skip_depth = 1
+            return
+        if local in self.extractor.block_tags or local == 'br':
+            self._end_line()
+
+    def end(self, tag):
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+        if self._local(tag) in self.extractor.block_tags:
+            self._end_line()
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        self._end_line()
+
+    def _end_line(self):
+        if self.parts:
+            line = ' '.join(''.join(self.parts).split())
+            self.parts = []
+            if line:
+                self.lines.append(line)
+
+    def drain(self):
+        lines, self.lines = self.lines, []
+        return lines
@@ -1,19 +1,43 @@
 import os
+import time
+import threading
 import ydb
 import ydb.iam
+from metrics import query_metrics, QuerySample, rows_count
 
 
 class YdbAdapter:
-    """connection to YDB"""
+    """
+    connection to YDB.
+    Driver and session pool are shared by all adapters of the process,
+    so the handshake is paid once per container, not once per DbManager.
+    Prepared queries are cached by the SDK inside every session of the pool
+    """
 
-    def __init__(self):
-        self.driver = None
-        self.pool = None
+    _driver = None
+    _pool = None
+    _connect_lock = threading.Lock()
+
+    @property
+    def driver(self):
+        return YdbAdapter._driver
+
+    @property
+    def pool(self):
+        return YdbAdapter._pool
 
     def _ensure_connected(self):
-        if self.driver:
+        if YdbAdapter._pool:
             return
 
+        with YdbAdapter._connect_lock:
+            if YdbAdapter._pool:
+                # соединение уже создал другой поток (например, прогрев)
+                return
+            self._connect()
+
+    def _connect(self):
+        driver = None
         try:
             # Отладочная информация
             endpoint = os.getenv('YDB_ENDPOINT', '').rstrip('/')
@@ -23,7 +47,7 @@ class YdbAdapter:
             # Используем метаданные сервисного аккаунта для аутентификации
             credentials = ydb.iam.MetadataUrlCredentials()
 
-            self.driver = ydb.Driver(
+            driver = ydb.Driver(
                 endpoint=endpoint,
                 database=database,
                 credentials=credentials,
@@ -32,23 +56,60 @@ class YdbAdapter:
 
             # Wait for the driver to become active for requests.
             print("Waiting for YDB driver to become active...")
-            self.driver.wait(fail_fast=True, timeout=10)
+            driver.wait(fail_fast=True, timeout=10)
             print("YDB driver is ready!")
 
             # Create the session pool instance to manage YDB sessions.
-            self.pool = ydb.SessionPool(self.driver)
+            YdbAdapter._driver = driver
+            YdbAdapter._pool = ydb.SessionPool(driver)
             print("YDB session pool created successfully!")
 
         except Exception as e:
             print(f"Error connecting to YDB: {str(e)}")
+            if driver is not None and YdbAdapter._driver is not driver:
+                driver.stop()
             raise
 
+    def health_check(self):
+        """
+        Проверяет соединение с YDB простым запросом
+
+        Returns:
+            bool: True, если YDB отвечает
+        """
+        started = time.monotonic()
+        try:
+            self.execute_query("SELECT 1 AS ok;")
+            print(f"💚 YDB health check: ok за {time.monotonic() - started:.3f}s")
+            return True
+        except Exception as e:
+            print(f"💔 YDB health check failed за {time.monotonic() - started:.3f}s: {e}")
+            return False
+
+    def warm_up(self, background=True):
+        """
+        Прогрев холодного контейнера: создает драйвер, пул и первую сессию
+        до прихода первого запроса
+
+        Args:
+            background: Прогревать в фоновом потоке, не задерживая инициализацию
+
+        Returns:
+            threading.Thread фонового прогрева или результат health_check
+        """
+        if not background:
+            return self.health_check()
+        thread = threading.Thread(target=self.health_check, name='ydb-warm-up', daemon=True)
+        thread.start()
+        return thread
+
     def _run_transaction(self, session, query, parameters=None):
         # Create the transaction and execute query.
         tx = session.transaction()
 
         if parameters:
-            # Для параметризованных запросов используем prepare
+            # session.prepare отдает запрос, уже подготовленный в этой сессии, без обращения к серверу;
+            # если сервер его забыл, SDK убирает его из кэша сессии, и retry_operation_sync готовит заново
             prepared_query = session.prepare(query)
             return tx.execute(
                 prepared_query,
@@ -64,7 +125,7 @@ class YdbAdapter:
                 settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
             )
 
-    def execute_query(self, query, parameters=None):
+    def execute_query(self, query, parameters=None, name=None):
         """
         Выполняет SQL запрос к YDB
 
@@ -72,11 +133,35 @@ class YdbAdapter:
             query: SQL запрос (может содержать параметры вида $param_name)
             parameters: Словарь параметров для подстановки (опционально)
                        Например: {'$book_id': 1, '$book_name': 'Test'}
+            name: Имя запроса для метрик (по умолчанию - оператор и таблица)
 
         Returns:
             Результат выполнения запроса
         """
-        self._ensure_connected()
-        result = self.pool.retry_operation_sync(
-            lambda session: self._run_transaction(session, query, parameters))
-        return result
+        started = time.monotonic()
+        attempts = []  # время начала каждой попытки, пул вызывает callee заново при ретраях
+
+        def callee(session):
+            attempts.append(time.monotonic())
+            return self._run_transaction(session, query, parameters)
+
+        result = None
+        error = None
+        try:
+            self._ensure_connected()
+            result = self.pool.retry_operation_sync(callee)
+            return result
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            finished = time.monotonic()
+            query_metrics.record(QuerySample(
+                name=name or query_metrics.normalize(query),
+                duration=finished - started,
+                session_wait=(attempts[0] if attempts else finished) - started,
+                retries=max(len(attempts) - 1, 0),
+                rows=rows_count(result),
+                ru=None,  # SDK не отдает стоимость data query
+                error=error,
+            ))
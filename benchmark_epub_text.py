@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Сравнение извлечения текста из глав EPUB: BeautifulSoup (прежний путь EpubReader)
+и потоковый XhtmlTextExtractor на lxml. Печатает время на мегабайт XHTML.
+
+    python benchmark_epub_text.py [file.epub ...] [--repeat N]
+"""
+
+import sys
+import os
+import time
+import zipfile
+import warnings
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from bs4 import BeautifulSoup as bs, XMLParsedAsHTMLWarning
+from xhtml_text_extractor import XhtmlTextExtractor
+
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+default_books = [
+    os.path.join(os.path.dirname(__file__), 'tests', 'test_book.epub'),
+    os.path.join(os.path.dirname(__file__), 'tests', 'test_brodsky.epub'),
+]
+
+
+def read_documents(epub_path):
+    with zipfile.ZipFile(epub_path) as archive:
+        return [archive.read(name) for name in archive.namelist()
+                if name.endswith(('.xhtml', '.html', '.htm'))]
+
+
+def soup_text(content):
+    # прежний путь: дерево BeautifulSoup, весь текст одной строкой
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        text = content.decode('latin-1')
+    soup = bs(text, "xml")
+    text = soup.body.get_text() if soup.body else soup.get_text()
+    return ' '.join(text.split())
+
+
+def measure(extract, documents, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for content in documents:
+            extract(content)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    args = sys.argv[1:]
+    repeat = 5
+    if '--repeat' in args:
+        index = args.index('--repeat')
+        repeat = int(args[index + 1])
+        del args[index:index + 2]
+    books = args or default_books
+    extractor = XhtmlTextExtractor()
+
+    for epub_path in books:
+        documents = read_documents(epub_path)
+        megabytes = sum(len(content) for content in documents) / (1024 * 1024)
+        soup_seconds = measure(soup_text, documents, repeat)
+        lxml_seconds = measure(extractor.extract, documents, repeat)
+        soup_words = sum(len(soup_text(content).split()) for content in documents)
+        lxml_words = sum(len(extractor.extract(content).split()) for content in documents)
+        print(f"📚 {os.path.basename(epub_path)}: {len(documents)} документов, {megabytes:.2f} MB XHTML")
+        print(f"   BeautifulSoup: {soup_seconds * 1000 / megabytes:8.1f} ms/MB, слов {soup_words}")
+        print(f"   lxml stream:   {lxml_seconds * 1000 / megabytes:8.1f} ms/MB, слов {lxml_words}")
+        print(f"   ускорение:     {soup_seconds / lxml_seconds:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import os
+import unittest
+from datetime import datetime
+import config
+from auto_sender import AutoSender, trigger_time
+
+
+def delivery(user_id):
+    return {'user_id': user_id, 'chat_id': user_id + 1000, 'lang': 'en', 'time': '20:20',
+            'portion': {'text': 'chunk', 'pos': 1}}
+
+
+class FakeDb(object):
+    def __init__(self, users, page_size=2, fail_after=None, run=None):
+        self.users = users
+        self.page_size = page_size
+        self.fail_after = fail_after
+        self.run = run
+        self.checkpoints = []
+        self.created = []
+        self.stale = []
+        self.finished = []
+        self.log = []
+
+    def get_auto_send_run(self, slot, shard):
+        return self.run
+
+    def checkpoint_auto_send_run(self, slot, shard, last_user_id, delivered, status):
+        self.checkpoints.append((shard, last_user_id, delivered, status))
+        self.run = {'slot': slot, 'shard': shard, 'lastUserId': last_user_id,
+                    'delivered': delivered, 'status': status}
+
+    def delivery_slot(self, current_time):
+        return current_time.strftime('%Y-%m-%d %H:%M')
+
+    def finish_deliveries(self, slot, sent_user_ids, failed):
+        self.finished.append((slot, sent_user_ids, [d['user_id'] for d in failed]))
+        self.log.append(('finish', sent_user_ids))
+
+    def iter_due_delivery_pages(self, slot, page_size=None, shard=0, shards=1, after_user_id=0):
+        users = [u for u in self.users if u % shards == shard and u > after_user_id]
+        pages = 0
+        for start in range(0, len(users), self.page_size):
+            if self.fail_after is not None and pages == self.fail_after:
+                yield None
+                return
+            pages += 1
+            self.log.append(('read', users[start]))
+            yield [delivery(u) for u in users[start:start + self.page_size]]
+
+    def create_auto_send_run(self, slot, shards):
+        self.created.append((slot, shards))
+        return list(range(shards))
+
+    def get_stale_auto_send_runs(self, since_slot, stale_seconds):
+        return self.stale
+
+
+class FakeQueue(object):
+    def __init__(self):
+        self.messages = []
+
+    def send_auto_send_shard_message(self, shard_data):
+        self.messages.append(shard_data)
+        return True
+
+
+class FakeEngine(object):
+    stats = {}
+
+    def run(self, items, deliver):
+        return [deliver(item) for item in items], {'items': len(items), 'messages_sent': len(items),
+                                                    'elapsed_seconds': 0.5}
+
+
+class TestAutoSendShards(unittest.TestCase):
+    def setUp(self):
+        self.write_behind = config.position_write_behind
+        config.position_write_behind = False
+        self.sender = AutoSender.__new__(AutoSender)
+        self.sender.engine = FakeEngine()
+        self.sender.queue_sender = FakeQueue()
+        self.sent = []
+        self.sender.send_portion_to_user = lambda user_id, chat_id, lang, portion, prefetched: \
+            self.sent.append(user_id) or {'success': True}
+
+    def tearDown(self):
+        config.position_write_behind = self.write_behind
+
+    def test_shard_checkpoints_pages(self):
+        self.sender.db = FakeDb([1, 2, 3, 4, 5, 6, 7, 8, 9])
+        stats = self.sender.process_shard({'slot': '2024-01-01 20:20', 'time': '20:20', 'shard': 1, 'shards': 3})
+        self.assertEqual(self.sent, [1, 4, 7])
+        self.assertEqual(stats['delivered'], 3)
+        self.assertEqual(stats['delivery']['items'], 3)
+        self.assertEqual(stats['delivery']['messages_per_second'], 3.0)
+        self.assertEqual(self.sender.db.checkpoints, [
+            (1, 0, 0, 'running'), (1, 4, 2, 'running'), (1, 7, 3, 'running'), (1, 7, 3, 'done')])
+        self.assertEqual(self.sender.db.finished, [
+            ('2024-01-01 20:20', [1, 4], []), ('2024-01-01 20:20', [7], [])])
+
+    def test_failed_send_released(self):
+        self.sender.db = FakeDb([1, 2, 3])
+        self.sender.send_portion_to_user = lambda user_id, chat_id, lang, portion, prefetched: \
+            {'success': False, 'error': 'timeout'} if user_id == 2 else {'success': True}
+        stats = self.sender.process_shard({'slot': '2024-01-01 20:20', 'shard': 0, 'shards': 1})
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(self.sender.db.finished, [
+            ('2024-01-01 20:20', [1], [2]), ('2024-01-01 20:20', [3], [])])
+
+    def test_shard_resumes_after_failure(self):
+        db = FakeDb([2, 4, 6, 8, 10], fail_after=1)
+        self.sender.db = db
+        shard_data = {'slot': '2024-01-01 20:20', 'time': '20:20', 'shard': 0, 'shards': 2}
+        with self.assertRaises(RuntimeError):
+            self.sender.process_shard(shard_data)
+        self.assertEqual(db.run['status'], 'running')
+        self.assertEqual(db.run['lastUserId'], 4)
+
+        db.fail_after = None
+        stats = self.sender.process_shard(shard_data)
+        self.assertEqual(self.sent, [2, 4, 6, 8, 10])
+        self.assertEqual(stats['delivered'], 5)
+        self.assertEqual(db.run['status'], 'done')
+
+    def test_shard_rate_limit_split(self):
+        token = os.environ.get('TOKEN')
+        os.environ['TOKEN'] = 'test'
+        try:
+            sender = AutoSender(shards=3)
+        finally:
+            if token is None:
+                del os.environ['TOKEN']
+            else:
+                os.environ['TOKEN'] = token
+        self.assertEqual(sender.engine.limiter.global_bucket.rate, config.telegram_global_rate / 3)
+
+    def test_done_shard_skipped(self):
+        self.sender.db = FakeDb([1, 2], run={'lastUserId': 2, 'delivered': 2, 'status': 'done'})
+        stats = self.sender.process_shard({'slot': '2024-01-01 20:20', 'shard': 0, 'shards': 1})
+        self.assertTrue(stats['skipped'])
+        self.assertEqual(self.sent, [])
+
+    def test_slot_streams_pages(self):
+        # every page is sent and finished before the next one is read
+        self.sender.db = FakeDb([1, 2, 3, 4, 5])
+        self.sender.queue_sender = None
+        stats = self.sender.process_auto_send(datetime(2024, 1, 1, 20, 20))
+        self.assertEqual(self.sent, [1, 2, 3, 4, 5])
+        self.assertEqual(stats['successful_sends'], 5)
+        self.assertEqual(stats['pages'], 3)
+        self.assertEqual(self.sender.db.log, [
+            ('read', 1), ('finish', [1, 2]), ('read', 3), ('finish', [3, 4]), ('read', 5), ('finish', [5])])
+
+    def test_slot_page_failure_sends_nothing(self):
+        # without a page there are no ledger rows, so nothing is sent outside of them
+        self.sender.db = FakeDb([1, 2, 3], fail_after=0)
+        self.sender.queue_sender = None
+        with self.assertRaises(RuntimeError):
+            self.sender.process_auto_send(datetime(2024, 1, 1, 20, 20))
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.sender.db.finished, [])
+
+    def test_trigger_time(self):
+        event = {'messages': [{'event_metadata': {'created_at': '2024-01-01T20:20:00.412345678Z'}}]}
+        self.assertEqual(trigger_time(event), datetime(2024, 1, 1, 20, 20))
+        self.assertIsInstance(trigger_time({'trigger_type': 'timer'}), datetime)
+
+    def test_fan_out_queues_shards_and_stale(self):
+        db = FakeDb([])
+        db.stale = [{'slot': '2024-01-01 20:19', 'shard': 2, 'shards': 4, 'lastUserId': 40,
+                     'delivered': 10, 'status': 'running', 'updatedAt': 0}]
+        self.sender.db = db
+        stats = self.sender.fan_out(datetime(2024, 1, 1, 20, 20))
+        messages = self.sender.queue_sender.messages
+        self.assertEqual(db.created, [('2024-01-01 20:20', config.auto_send_shards)])
+        self.assertEqual(stats['shards_queued'], config.auto_send_shards)
+        self.assertEqual(stats['shards_resumed'], 1)
+        self.assertEqual(messages[-1], {'slot': '2024-01-01 20:19', 'time': '20:19', 'shard': 2, 'shards': 4})
+        self.assertEqual(db.checkpoints, [(2, 40, 10, 'queued')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import unittest
+from chapter_pool import ChapterPool
+from epub_container import EpubContainer
+from txt_file import BookChunkManager
+
+
+class TestChapterPool(unittest.TestCase):
+    def setUp(self):
+        self.epub_path = os.path.join(os.getcwd(), 'test_book.epub')
+        container = EpubContainer(self.epub_path)
+        self.item_ids = container.document_ids()
+        container.close()
+
+    def tearDown(self):
+        pass
+
+    def test_pool_keeps_order(self):
+        serial = list(ChapterPool(1).iter_chunks(self.epub_path, self.item_ids, 'by_sense'))
+        parallel = list(ChapterPool(2).iter_chunks(self.epub_path, self.item_ids, 'by_sense'))
+        self.assertEqual([index for index, _, _ in serial], list(range(len(self.item_ids))))
+        self.assertEqual(parallel, serial)
+        self.assertTrue(any(chunks for _, _, chunks in serial))
+
+    def test_missing_item(self):
+        result = list(ChapterPool(1).iter_chunks(self.epub_path, ['no-such-item'], 'by_sense'))
+        self.assertEqual(result, [(0, 'no-such-item', [])])
+
+    def test_build_chunks(self):
+        text = '\n'.join(f'Строка номер {i}.' for i in range(12))
+        chunks = BookChunkManager.build_chunks(text, 'by_newline')
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith('Строка номер 0. Строка номер 1.'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from chunk_cache import ChunkCache
+from txt_file import BookChunkManager
+
+
+class FakeDb(object):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.range_queries = []
+
+    def get_chunks_range(self, book_id, first_id, last_id):
+        self.range_queries.append((book_id, first_id, last_id))
+        return {i: self.chunks[i] for i in range(first_id, last_id + 1) if i in self.chunks}
+
+
+class TestChunkCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ChunkCache(max_bytes=10)
+
+    def tearDown(self):
+        pass
+
+    def test_lru_by_bytes(self):
+        self.cache.put(1, 0, 'aaaa')
+        self.cache.put(1, 1, 'bbbb')
+        self.cache.get(1, 0)
+        self.cache.put(1, 2, 'cccc')  # 12 bytes, least recently used (1, 1) goes away
+        self.assertIsNone(self.cache.get(1, 1))
+        self.assertEqual(self.cache.get(1, 0), 'aaaa')
+        self.assertEqual(self.cache.stats()['bytes'], 8)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_utf8_size(self):
+        self.cache.put(1, 0, 'ёёёёё')  # 10 bytes in utf-8
+        self.cache.put(1, 1, 'ж')
+        self.assertIsNone(self.cache.get(1, 0))
+        self.assertEqual(self.cache.stats()['bytes'], 2)
+
+    def test_read_piece_prefetch(self):
+        manager = BookChunkManager()
+        manager.db = FakeDb({i: f'chunk {i}' for i in range(5)})
+        manager.cache = ChunkCache(max_bytes=1000)
+        manager.prefetch_size = 3
+        texts = [manager.read_piece(7, pos) for pos in range(6)]
+        self.assertEqual(texts[0], ('chunk 0', 1))
+        self.assertEqual(texts[4], ('chunk 4', 5))
+        self.assertEqual(texts[5], (None, 5))
+        self.assertEqual(manager.db.range_queries, [(7, 0, 2), (7, 3, 5), (7, 5, 7)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import time
+import unittest
+from delivery_engine import TokenBucket, TelegramRateLimiter, DeliveryEngine, TooManyRequests
+
+
+class TestDeliveryEngine(unittest.TestCase):
+    def setUp(self):
+        self.limiter = TelegramRateLimiter(global_rate=1000, chat_rate=1000)
+        self.engine = DeliveryEngine(workers=4, limiter=self.limiter, max_retries=2)
+
+    def tearDown(self):
+        pass
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+
+    def test_retry_after_429(self):
+        answers = [TooManyRequests(0.01), 'ok']
+
+        def send_once():
+            answer = answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        self.assertEqual(self.engine.send(1, send_once), 'ok')
+        self.assertEqual(self.engine.stats['retries_429'], 1)
+        self.assertEqual(self.engine.stats['messages_sent'], 1)
+
+    def test_too_many_retries(self):
+        def send_once():
+            raise TooManyRequests(0.001)
+
+        with self.assertRaises(TooManyRequests):
+            self.engine.send(1, send_once)
+        self.assertEqual(self.engine.stats['messages_failed'], 1)
+
+    def test_run(self):
+        def deliver(user_id):
+            if user_id == 3:
+                raise ValueError('no chat')
+            self.engine.send(user_id, lambda: None)
+            return {'success': True}
+
+        results, stats = self.engine.run([1, 2, 3, 4], deliver)
+        self.assertEqual([r['success'] for r in results], [True, True, False, True])
+        self.assertEqual(stats['messages_sent'], 3)
+        self.assertEqual(stats['items'], 4)
+
+    def test_chat_rate(self):
+        limiter = TelegramRateLimiter(global_rate=1000, chat_rate=20)
+        started = time.monotonic()
+        for _ in range(3):
+            limiter.acquire(42)
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from db_manager import DbManager
+
+
+def due_row(row_id, book_id=10, pos=0, text='chunk'):
+    return {'id': row_id, 'userId': 1000 + row_id, 'chatId': 2000 + row_id, 'lang': 'en', 'time': '20:20',
+            'bookId': book_id, 'pos': pos, 'mode': 'normal', 'chunkCount': 5, 'status': 'ready', 'text': text}
+
+
+class PagedAdapter(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def execute_query(self, query, parameters=None, name=None):
+        self.calls.append(parameters)
+        # LIMIT is applied to schedule rows, users filtered out by the join don't come back
+        scanned = [row for row in self.rows if row['userId'] > parameters['$last_user_id']][:parameters['$limit']]
+        page = [row for row in scanned if not row.get('filtered')]
+        scan = {'scanned': len(scanned), 'lastUserId': scanned[-1]['userId'] if scanned else None}
+        return [SimpleNamespace(rows=page), SimpleNamespace(rows=[scan])]
+
+
+def due_deliveries(db, current_time, page_size=None):
+    # all pages of the slot; None if the first page failed
+    deliveries = []
+    for page in db.iter_due_delivery_pages(db.delivery_slot(current_time), page_size=page_size):
+        if page is None:
+            return deliveries or None
+        deliveries.extend(page)
+    return deliveries
+
+
+class TestDueDeliveries(unittest.TestCase):
+    def setUp(self):
+        self.db = DbManager()
+        self.db.positions = None
+
+    def tearDown(self):
+        pass
+
+    def test_pages(self):
+        rows = [due_row(i) for i in range(1, 6)]
+        rows[2] = due_row(3, book_id=None, pos=None, text=None)
+        self.db.db_adapter = PagedAdapter(rows)
+        deliveries = due_deliveries(self.db, datetime(2024, 1, 1, 20, 20), page_size=2)
+        self.assertEqual([d['user_id'] for d in deliveries], [1001, 1002, 1003, 1004, 1005])
+        self.assertEqual([call['$last_user_id'] for call in self.db.db_adapter.calls], [0, 1002, 1004])
+        self.assertEqual(self.db.db_adapter.calls[0]['$current_time'], '20:20')
+        self.assertIsNone(deliveries[2]['portion'])
+        self.assertEqual(deliveries[0]['portion']['text'], 'chunk')
+        self.assertEqual(deliveries[0]['portion']['pos'], 1)
+
+    def test_filtered_page_continues(self):
+        # first schedule page has no due users, the scan goes on
+        rows = [due_row(i) for i in range(1, 6)]
+        for row in rows[:2]:
+            row['filtered'] = True
+        self.db.db_adapter = PagedAdapter(rows)
+        deliveries = due_deliveries(self.db, datetime(2024, 1, 1, 20, 20), page_size=2)
+        self.assertEqual([d['user_id'] for d in deliveries], [1003, 1004, 1005])
+        self.assertEqual([call['$last_user_id'] for call in self.db.db_adapter.calls], [0, 1002, 1004])
+
+    def test_claimed_users_skipped(self):
+        rows = [due_row(i) for i in range(1, 4)]
+        rows[1]['ledgerStatus'] = 'sent'
+        self.db.db_adapter = PagedAdapter(rows)
+        deliveries = due_deliveries(self.db, datetime(2024, 1, 1, 20, 20), page_size=3)
+        self.assertEqual([d['user_id'] for d in deliveries], [1001, 1003])
+        self.assertEqual(self.db.db_adapter.calls[0]['$delivery_slot'], '2024-01-01 20:20')
+        # claims older than delivery_claim_timeout are taken again
+        self.assertLess(self.db.db_adapter.calls[0]['$claim_before'], self.db.db_adapter.calls[0]['$now'])
+
+    def test_first_page_failed(self):
+        class FailingAdapter(object):
+            def execute_query(self, query, parameters=None, name=None):
+                raise RuntimeError('ydb is unavailable')
+
+        self.db.db_adapter = FailingAdapter()
+        self.assertIsNone(due_deliveries(self.db, datetime(2024, 1, 1, 20, 20)))
+
+
+    def test_update_time_moves_schedule(self):
+        class RecordingAdapter(object):
+            def __init__(self):
+                self.calls = []
+
+            def execute_query(self, query, parameters=None, name=None):
+                self.calls.append((query, parameters))
+                return [SimpleNamespace(rows=[{'userId': 913002, 'time': '09:00'}])]
+
+        self.db.db_adapter = RecordingAdapter()
+        self.db.update_user_time(913002, '20:20')
+        query, parameters = self.db.db_adapter.calls[-1]
+        self.assertIs(query, DbManager.sync_schedule_query)
+        self.assertEqual(parameters, {'$user_id': 913002, '$old_time': '09:00'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import os
+import ebooklib
+from ebooklib import epub
+from epub_container import EpubContainer
+
+
+class TestEpubContainer(unittest.TestCase):
+    def setUp(self):
+        self.epub_paths = [os.path.join(os.getcwd(), name) for name in ('test_book.epub', 'test_brodsky.epub')]
+
+    def tearDown(self):
+        pass
+
+    def test_parity_with_ebooklib(self):
+        # same title, spine, documents and their content as ebooklib gives
+        for epub_path in self.epub_paths:
+            book = epub.read_epub(epub_path)
+            container = EpubContainer(epub_path)
+            documents = list(book.get_items_of_type(ebooklib.ITEM_DOCUMENT))
+            self.assertEqual(container.title, book.title)
+            self.assertEqual(container.spine, [item[0] for item in book.spine])
+            self.assertEqual(container.document_ids(), [item.id for item in documents])
+            for item in documents:
+                self.assertEqual(container.read(item.id), item.content)
+            container.close()
+
+    def test_missing_item(self):
+        container = EpubContainer(self.epub_paths[0])
+        self.assertIsNone(container.open('no-such-item'))
+        container.close()
+
+    def test_toc(self):
+        container = EpubContainer(self.epub_paths[1])
+        self.assertTrue(container.toc)
+        self.assertTrue(all(isinstance(title, str) for title, _ in container.toc if title))
+        container.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
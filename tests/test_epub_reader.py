@@ -30,6 +30,28 @@ class TestEpubReader(unittest.TestCase):
         result = text.split()
         self.assertEqual(result[1], 'Саймон')
 
+    def test_spine_order(self):
+        efr = EpubReader(self.epub_path)
+        in_spine = [item for item in efr.item_ids if item in efr.spine_index]
+        self.assertEqual(in_spine, sorted(in_spine, key=efr.spine_ids.index))
+
+    def test_seek(self):
+        # reading from item 3 gives the same text as reading items one by one
+        efr = EpubReader(self.epub_path)
+        while efr.cursor < 4:
+            expected = efr.get_next_item_text()
+        efr_seek = EpubReader(self.epub_path)
+        efr_seek.seek(3)
+        self.assertEqual(efr_seek.get_next_item_text(), expected)
+        self.assertEqual(efr_seek.remaining(), len(efr_seek.item_ids) - 4)
+
+
+    def test_close(self):
+        with EpubReader(self.epub_path) as reader:
+            self.assertIsNotNone(reader.get_next_item_text())
+        self.assertIsNone(reader.book.zip.fp)
+        EpubReader('').close()
+
 
 if __name__ == '__main__':
     unittest.main()
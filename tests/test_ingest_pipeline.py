@@ -0,0 +1,68 @@
+import time
+import unittest
+from ingest_pipeline import IngestPipeline
+from txt_file import BookChunkManager
+
+
+class FakeChapterPool(object):
+    workers = 1
+
+    def __init__(self, chapters):
+        self.chapters = chapters
+        self.produced = 0
+
+    def iter_chunks(self, epub_path, item_ids, sent_mode):
+        for index, chunks in enumerate(self.chapters):
+            self.produced += 1
+            yield index, f'item{index}', chunks
+
+
+class SlowChunkManager(object):
+    def __init__(self, pool):
+        self.pool = pool
+        self.saved = []
+        self.produced_at_save = []
+
+    def save_chunks(self, book_id, chunks):
+        self.produced_at_save.append(self.pool.produced)
+        time.sleep(0.01)
+        self.saved.append(list(chunks))
+        return len(chunks)
+
+
+class TestIngestPipeline(unittest.TestCase):
+    def setUp(self):
+        chapters = [[f'c{i}-{j}' for j in range(3)] for i in range(10)]
+        chapters[4] = []
+        self.pool = FakeChapterPool(chapters)
+        self.chunk_manager = SlowChunkManager(self.pool)
+        self.pipeline = IngestPipeline(self.chunk_manager, self.pool, batch_size=2, queue_batches=1)
+
+    def tearDown(self):
+        pass
+
+    def test_batches_in_order(self):
+        first_writes = []
+        stats = self.pipeline.run(1, 'book.epub', [f'item{i}' for i in range(10)], 'by_sense',
+                                  on_first_write=lambda: first_writes.append(len(self.chunk_manager.saved)))
+        written = [chunk for batch in self.chunk_manager.saved for chunk in batch]
+        self.assertEqual(written, [chunk for chapter in self.pool.chapters for chunk in chapter])
+        self.assertTrue(all(len(batch) <= 2 for batch in self.chunk_manager.saved))
+        self.assertEqual(stats, {'chunks_created': 27, 'blocks_processed': 9, 'empty_blocks_skipped': 1})
+        self.assertEqual(first_writes, [1])
+
+    def test_backpressure(self):
+        # writer is slow and queue holds one batch: chapters are not read far ahead of writes
+        self.pipeline.run(1, 'book.epub', [f'item{i}' for i in range(10)], 'by_sense')
+        self.assertLess(self.chunk_manager.produced_at_save[0], 10)
+
+    def test_chunks_of_blocks(self):
+        # small blocks give the same chunks as the whole text at once
+        lines = [f'Строка номер {i}.' for i in range(23)]
+        whole = BookChunkManager.build_chunks('\n'.join(lines), 'by_newline')
+        streamed = list(BookChunkManager.iter_chunks(iter(lines), 'by_newline', block_size=40))
+        self.assertEqual(streamed, whole)
+
+
+if __name__ == '__main__':
+    unittest.main()
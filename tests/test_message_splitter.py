@@ -0,0 +1,79 @@
+import unittest
+from message_splitter import MessageSplitter
+
+
+class TestMessageSplitter(unittest.TestCase):
+    def setUp(self):
+        self.splitter = MessageSplitter(max_size=50)
+
+    def tearDown(self):
+        pass
+
+    def test_short_text(self):
+        self.assertEqual(self.splitter.split('Короткий текст.'), ['Короткий текст.'])
+        self.assertEqual(self.splitter.split(''), [])
+
+    def test_sentence_boundary(self):
+        text = 'Первое предложение здесь. Второе предложение тоже тут. Третье.'
+        pieces = self.splitter.split(text)
+        self.assertEqual(pieces[0], 'Первое предложение здесь.')
+        self.assertTrue(all(len(piece) <= 50 for piece in pieces))
+        self.assertEqual(' '.join(pieces), text)
+
+    def test_paragraph_boundary(self):
+        text = 'Абзац один, довольно длинный текст.\nАбзац два. И еще немного.'
+        pieces = self.splitter.split(text)
+        self.assertEqual(pieces[0], 'Абзац один, довольно длинный текст.')
+
+    def test_words_are_not_cut(self):
+        text = ' '.join(['слово'] * 30)
+        for piece in self.splitter.split(text):
+            self.assertLessEqual(len(piece), 50)
+            self.assertEqual(set(piece.split(' ')), {'слово'})
+
+    def test_html_balance(self):
+        splitter = MessageSplitter(max_size=120)
+        text = '<b>' + ' '.join(['жирный текст.'] * 20) + '</b> &amp; конец'
+        pieces = splitter.split(text)
+        self.assertGreater(len(pieces), 1)
+        for piece in pieces:
+            self.assertLessEqual(len(piece), 120)
+            self.assertEqual(piece.count('<b>'), piece.count('</b>'))
+        self.assertTrue(pieces[-1].endswith('&amp; конец'))
+
+    def test_nested_tags_fit(self):
+        # reopened tags and closing tags are counted in the piece length
+        text = '<b>' * 30 + ' '.join(['слово'] * 1000) + '</b>' * 30
+        pieces = MessageSplitter(max_size=3840).split(text)
+        self.assertGreater(len(pieces), 1)
+        self.assertTrue(all(len(piece) <= 3840 for piece in pieces))
+        for piece in pieces:
+            self.assertEqual(piece.count('<b>'), piece.count('</b>'))
+
+    def test_unclosed_tags_fit(self):
+        text = ' '.join(['<i>слово'] * 400)
+        for max_size in (50, 120, 3840):
+            pieces = MessageSplitter(max_size=max_size).split(text)
+            self.assertTrue(all(len(piece) <= max_size for piece in pieces), max_size)
+            self.assertEqual(''.join(pieces).count('слово'), 400)
+
+    def test_not_cut_inside_leading_tag(self):
+        tag_re = MessageSplitter._tag_re
+        texts = ['<a href="http://example.com/some/long/path">link</a> ' + 'word ' * 20,
+                 '<i><b>' + 'слово ' * 10 + '<a href="http://x.io/p">ссылка</a> ' + 'слово ' * 10 + '</b></i>']
+        for text in texts:
+            pieces = self.splitter.split(text)
+            self.assertNotIn('<', pieces)
+            for piece in pieces:
+                self.assertLessEqual(len(piece), 50)
+                # no piece starts or ends in the middle of a tag
+                self.assertNotRegex(tag_re.sub('', piece), '[<>]')
+            self.assertEqual(''.join(pieces).count('ссылка'), text.count('ссылка'))
+
+    def test_long_word(self):
+        pieces = self.splitter.split('x' * 120)
+        self.assertEqual([len(piece) for piece in pieces], [50, 50, 20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from metrics import QueryMetrics, QuerySample, HistogramSink, PrometheusSink
+
+
+def sample(name, duration, retries=0, error=None):
+    return QuerySample(name=name, duration=duration, session_wait=0.001, retries=retries,
+                       rows=1, ru=None, error=error)
+
+
+class TestQueryMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = QueryMetrics()
+
+    def tearDown(self):
+        pass
+
+    def test_normalize(self):
+        query = """
+            DECLARE $user_id AS Uint64;
+
+            SELECT lang FROM users
+            WHERE userId = $user_id;
+        """
+        self.assertEqual(self.metrics.normalize(query), 'select users')
+        self.assertEqual(self.metrics.normalize('UPSERT INTO books (id) VALUES (1);'), 'upsert books')
+
+    def test_histogram_percentile(self):
+        histogram = self.metrics.add_sink(HistogramSink(buckets=(0.01, 0.1, 1.0)))
+        for _ in range(98):
+            self.metrics.record(sample('fast', 0.005))
+        self.metrics.record(sample('fast', 0.5, retries=2))
+        self.metrics.record(sample('fast', 3.0, error='Timeout'))
+        stats = histogram.snapshot()['fast']
+        self.assertEqual((stats['count'], stats['retries'], stats['errors']), (100, 2, 1))
+        self.assertEqual(histogram.percentile('fast', 0.5), 0.01)
+        self.assertEqual(histogram.percentile('fast', 0.99), 1.0)
+        self.assertEqual(histogram.percentile('fast', 1.0), 3.0)
+
+    def test_prometheus_dump(self):
+        sink = self.metrics.add_sink(PrometheusSink(buckets=(0.1,)))
+        self.metrics.record(sample('DbManager.get_user_lang', 0.05))
+        text = sink.dump()
+        self.assertIn('partybook_ydb_query_duration_seconds_bucket{query="DbManager.get_user_lang",le="0.1"} 1', text)
+        self.assertIn('partybook_ydb_query_duration_seconds_count{query="DbManager.get_user_lang"} 1', text)
+
+    def test_broken_sink(self):
+        class BrokenSink(object):
+            def record(self, sample):
+                raise ValueError('broken')
+        histogram = HistogramSink()
+        self.metrics.add_sink(BrokenSink())
+        self.metrics.add_sink(histogram)
+        self.metrics.record(sample('q', 0.1))
+        self.assertEqual(histogram.snapshot()['q']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
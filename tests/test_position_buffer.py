@@ -0,0 +1,75 @@
+import unittest
+from types import SimpleNamespace
+from position_buffer import PositionWriteBuffer
+from db_manager import DbManager
+
+
+class FakeAdapter(object):
+    def __init__(self, rows=None, fail=False):
+        self.rows = rows or []
+        self.fail = fail
+        self.calls = []
+
+    def execute_query(self, query, parameters=None, name=None):
+        self.calls.append((query, parameters))
+        if self.fail:
+            raise RuntimeError('ydb is unavailable')
+        return [SimpleNamespace(rows=self.rows)]
+
+
+class TestPositionWriteBuffer(unittest.TestCase):
+    def setUp(self):
+        self.adapter = FakeAdapter()
+        self.buffer = PositionWriteBuffer(self.adapter, batch_size=2)
+
+    def tearDown(self):
+        pass
+
+    def test_flush_in_batches(self):
+        for user_id in (1, 2, 3):
+            self.buffer.put(user_id, 10, 5)
+        self.buffer.put(1, 10, 6)  # newer position of the same book replaces older one
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(len(self.adapter.calls), 2)
+        positions = self.adapter.calls[0][1]['$positions'] + self.adapter.calls[1][1]['$positions']
+        self.assertIn({'userId': 1, 'bookId': 10, 'pos': 6}, positions)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_positions(self):
+        self.buffer.db_adapter = FakeAdapter(fail=True)
+        self.buffer.put(1, 10, 5)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(1, 10), 5)
+
+    def test_put_during_flush_is_kept(self):
+        buffer = self.buffer
+
+        class PuttingAdapter(FakeAdapter):
+            def execute_query(self, query, parameters=None, name=None):
+                # пользователь читает дальше, пока пакет пишется
+                buffer.put(1, 10, 7)
+                return super().execute_query(query, parameters, name)
+
+        buffer.db_adapter = PuttingAdapter()
+        buffer.put(1, 10, 5)
+        buffer.put(2, 10, 5)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(1, 10), 7)
+        self.assertIsNone(buffer.pending(2, 10))
+
+    def test_advance_position_reads_own_writes(self):
+        user_id = 913001
+        db = DbManager()
+        db.db_adapter = FakeAdapter(rows=[{'bookId': 10, 'pos': 3, 'mode': 'normal',
+                                           'chunkCount': 10, 'status': 'ready', 'lang': 'ru'}])
+        db.positions = self.buffer
+        self.buffer.put(user_id, 10, 5)
+        state = db.advance_position(user_id)
+        self.assertEqual(state['pos'], 5)
+        self.assertEqual(self.buffer.pending(user_id, 10), 6)
+        self.assertIs(db.db_adapter.calls[0][0], DbManager.read_position_query)
+
+
+if __name__ == '__main__':
+    unittest.main()
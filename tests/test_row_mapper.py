@@ -0,0 +1,36 @@
+import unittest
+from types import SimpleNamespace
+from row_mapper import RowMapper
+
+
+class TestRowMapper(unittest.TestCase):
+    def setUp(self):
+        self.mapper = RowMapper()
+
+    def tearDown(self):
+        pass
+
+    def test_empty_result(self):
+        self.assertEqual(self.mapper.rows(None), [])
+        self.assertIsNone(self.mapper.first([SimpleNamespace(rows=[])]))
+        self.assertEqual(self.mapper.scalar(None, 'count', 0), 0)
+
+    def test_text_with_quotes(self):
+        # text with quotes and newlines is returned untouched
+        text = 'Он сказал: "Don\'t", \'да\'\nи ушёл. True None'
+        result = [SimpleNamespace(rows=[{'text': text}])]
+        self.assertEqual(self.mapper.scalar(result, 'text'), text)
+
+    def test_bytes_value(self):
+        row = {'lang': 'en'.encode('utf-8')}
+        self.assertEqual(self.mapper.value(row, 'lang'), 'en')
+
+    def test_to_book(self):
+        row = {'ub.bookId': 7, 'b.bookName': '1_book', 'ub.pos': 3, 'ub.mode': 'poem'}
+        book = self.mapper.to_book(row, id_column='ub.bookId', name_column='b.bookName',
+                                   pos_column='ub.pos', mode_column='ub.mode')
+        self.assertEqual((book.id, book.name, book.pos, book.mode), (7, '1_book', 3, 'poem'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from types import SimpleNamespace
+from telebot import apihelper
+from telegram_client import TelegramClient, telegram_histogram
+
+
+class FakeSession(object):
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return SimpleNamespace(status_code=self.status_code)
+
+
+class TestTelegramClient(unittest.TestCase):
+    def setUp(self):
+        self.client = TelegramClient(token='123:abc', connect_timeout=1, read_timeout=2)
+        self.client.session = FakeSession()
+        telegram_histogram.reset()
+
+    def tearDown(self):
+        apihelper.CUSTOM_REQUEST_SENDER = None
+
+    def test_send_message(self):
+        self.client.send_message(42, 'text')
+        method, url, kwargs = self.client.session.calls[0]
+        self.assertEqual((method, url), ('post', 'https://api.telegram.org/bot123:abc/sendMessage'))
+        self.assertEqual(kwargs['json']['chat_id'], 42)
+        self.assertEqual(kwargs['timeout'], (1, 2))
+        self.assertEqual(telegram_histogram.snapshot()['sendMessage']['count'], 1)
+
+    def test_error_status(self):
+        self.client.session = FakeSession(status_code=429)
+        self.client.send_message(42, 'text')
+        self.assertEqual(telegram_histogram.snapshot()['sendMessage']['errors'], 1)
+
+    def test_telebot_sender(self):
+        self.client.install_for_telebot()
+        apihelper.CUSTOM_REQUEST_SENDER('get', 'https://api.telegram.org/bot123:abc/getMe',
+                                        params=None, files=None, timeout=(3, 5), proxies=None)
+        self.assertEqual(self.client.session.calls[0][2]['timeout'], (3, 5))
+        self.assertIn('getMe', telegram_histogram.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import unittest
+from types import SimpleNamespace
+from db_manager import DbManager
+from user_state_cache import UserStateCache
+
+
+class FailingWriteAdapter(object):
+    # user exists, every write fails
+    def execute_query(self, query, parameters=None, name=None):
+        if query.strip().split('\n')[-1].strip().startswith('SELECT'):
+            return [SimpleNamespace(rows=[{'userId': 1, 'time': '09:00'}])]
+        return None
+
+
+class TestUserStateCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = UserStateCache(ttl=60, max_users=2)
+
+    def tearDown(self):
+        pass
+
+    def test_set_get(self):
+        self.cache.set(1, lang='en', auto_send=False)
+        self.assertEqual(self.cache.get(1, 'lang'), 'en')
+        self.assertIs(self.cache.get(1, 'auto_send'), False)
+        self.assertIsNone(self.cache.get(1, 'time'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_ttl(self):
+        cache = UserStateCache(ttl=0.01, max_users=2)
+        cache.set(1, lang='en')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(1, 'lang'))
+
+    def test_size_bound(self):
+        for user_id in (1, 2, 3):
+            self.cache.set(user_id, lang='ru')
+        self.assertIsNone(self.cache.get(1, 'lang'))
+        self.assertEqual(self.cache.stats()['users'], 2)
+
+    def test_update_pos(self):
+        self.cache.set(1, current_book=(7, 'book', 3, 'normal'))
+        self.cache.update_pos(1, 7, 4)
+        self.assertEqual(self.cache.get(1, 'current_book'), (7, 'book', 4, 'normal'))
+        self.cache.update_pos(1, 8, 0)  # other book became current - drop cached one
+        self.assertIsNone(self.cache.get(1, 'current_book'))
+
+    def test_invalidate(self):
+        self.cache.set(1, lang='en', time='09:00')
+        self.cache.invalidate(1, 'lang')
+        self.assertIsNone(self.cache.get(1, 'lang'))
+        self.assertEqual(self.cache.get(1, 'time'), '09:00')
+        self.cache.invalidate(1)
+        self.assertIsNone(self.cache.get(1, 'time'))
+
+    def test_failed_write_not_cached(self):
+        db = DbManager()
+        db.db_adapter = FailingWriteAdapter()
+        db.user_state = self.cache
+        self.cache.set(1, lang='en', auto_send=True)
+        self.assertEqual(db.update_user_lang(1, 'ru'), -1)
+        self.assertEqual(db.update_auto_status(1, False), -1)
+        self.assertIsNone(self.cache.get(1, 'lang'))
+        self.assertIsNone(self.cache.get(1, 'auto_send'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import io
+import unittest
+from xhtml_text_extractor import XhtmlTextExtractor
+
+
+document = '''<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+  <head><title>Глава</title><style>p { margin: 0 }</style></head>
+  <body>
+    <h1>Глава   первая</h1>
+    <p>Первый <b>абзац</b>
+       в две строки.<a epub:type="noteref" href="#n1">1</a></p>
+    <p>Строка стиха<br/>вторая строка</p>
+    <script>var x = 1;</script>
+    <aside epub:type="footnote" id="n1"><p>Текст сноски</p></aside>
+    <p>Последний<a class="note_anchor" href="#back">n1</a></p>
+  </body>
+</html>'''.encode('utf-8')
+
+
+class TestXhtmlTextExtractor(unittest.TestCase):
+    def setUp(self):
+        self.extractor = XhtmlTextExtractor(feed_size=16)
+
+    def tearDown(self):
+        pass
+
+    def test_lines(self):
+        lines = list(self.extractor.iter_lines(document))
+        self.assertEqual(lines, ['Глава первая', 'Первый абзац в две строки.',
+                                 'Строка стиха', 'вторая строка', 'Последний'])
+
+    def test_file_object(self):
+        self.assertEqual(self.extractor.extract(io.BytesIO(document)),
+                         self.extractor.extract(document))
+
+    def test_broken_markup(self):
+        text = self.extractor.extract(b'<html><body><p>one &nbsp; two<p>three</body></html>')
+        self.assertEqual(text.split(), ['one', 'two', 'three'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import unittest
+import ydb
+import ydb.iam
+from ydb_adapter import YdbAdapter
+
+
+class FakeDriver(object):
+    created = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        FakeDriver.created.append(self)
+
+    def wait(self, fail_fast=True, timeout=None):
+        pass
+
+    def stop(self):
+        pass
+
+
+class FakeSessionPool(object):
+    def __init__(self, driver):
+        self.driver = driver
+
+
+class TestYdbAdapterShared(unittest.TestCase):
+    def setUp(self):
+        # connection is made with stubs instead of a real YDB
+        self.saved = (ydb.Driver, ydb.SessionPool, ydb.iam.MetadataUrlCredentials, ydb.load_ydb_root_certificate)
+        ydb.Driver = FakeDriver
+        ydb.SessionPool = FakeSessionPool
+        ydb.iam.MetadataUrlCredentials = lambda: None
+        ydb.load_ydb_root_certificate = lambda: None
+        FakeDriver.created = []
+        YdbAdapter._driver = None
+        YdbAdapter._pool = None
+
+    def tearDown(self):
+        ydb.Driver, ydb.SessionPool, ydb.iam.MetadataUrlCredentials, ydb.load_ydb_root_certificate = self.saved
+        YdbAdapter._driver = None
+        YdbAdapter._pool = None
+
+    def test_adapters_share_connection(self):
+        first, second = YdbAdapter(), YdbAdapter()
+        first._ensure_connected()
+        second._ensure_connected()
+        self.assertEqual(len(FakeDriver.created), 1)
+        self.assertIsInstance(first.driver, FakeDriver)
+        self.assertIsInstance(first.pool, FakeSessionPool)
+        self.assertIs(first.driver, second.driver)
+        self.assertIs(first.pool, second.pool)
+        self.assertIs(first.pool.driver, first.driver)
+
+    def test_concurrent_connect(self):
+        adapters = [YdbAdapter() for _ in range(8)]
+        threads = [threading.Thread(target=adapter._ensure_connected) for adapter in adapters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(FakeDriver.created), 1)
+        self.assertEqual(len({id(adapter.pool) for adapter in adapters}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()